@@ -1,6 +1,12 @@
+import os
+import threading
 import requests
 from typing import Optional
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 from pydantic import BaseModel
+from utils.rate_limit import RateLimiter
+from utils.resilience import CircuitBreaker, RetryPolicy, resilient_call
 
 
 class LinkMetadataModel(BaseModel):
@@ -14,13 +20,24 @@ class LinkMetadataModel(BaseModel):
 class AmoCRMClient:
 
     AMO_API_URL = "https://{}.amocrm.ru/api/v4"
+    # Сколько сущностей amo принимает в одном POST/PATCH
+    BATCH_LIMIT = 250
 
-    def __init__(self, token, subdomain):
+    def __init__(self, token, subdomain, session: requests.Session = None):
         self.token = token
         self.subdomain = subdomain
         self.base_url = self.AMO_API_URL.format(self.subdomain)
-        self.session = requests.Session()
-        self.session.headers = self._get_headers()
+        # Токен уходит в заголовках каждого запроса, сессию можно делить между клиентами
+        self.session = session or _session()
+        self.timeout = (
+            settings.AMO_HTTP_CONNECT_TIMEOUT,
+            settings.AMO_HTTP_READ_TIMEOUT,
+        )
+        self.rate_limiter = RateLimiter(
+            f"amo:{subdomain}",
+            settings.AMO_RATE_LIMIT,
+            background_reserve=settings.RATE_LIMIT_INTERACTIVE_RESERVE,
+        )
 
     def _get_headers(self):
         return {
@@ -28,19 +45,97 @@ class AmoCRMClient:
             "Content-Type": "application/json",
         }
 
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        # Предохранитель на аккаунт и сущность: "GET leads", "PATCH contacts"...
+        entity = url[len(self.base_url) :].strip("/").split("/")[0]
+        breaker = CircuitBreaker(f"amo:{self.subdomain}:{method} {entity}")
+        retry = RetryPolicy() if method == "GET" else None
+        kwargs.setdefault("timeout", self.timeout)
+
+        def call():
+            self.rate_limiter.acquire()
+            return self.session.request(
+                method, url, headers=self._get_headers(), **kwargs
+            )
+
+        return resilient_call(call, breaker, retry)
+
+    def _batch(
+        self,
+        method: str,
+        url: str,
+        items: dict,
+        embedded: str = None,
+        request_ids: bool = True,
+    ) -> tuple[dict, dict]:
+        """
+        Отправляет сущности пачками по BATCH_LIMIT: items - {ключ: сущность}.
+        Ключ уходит в request_id, по нему (или по порядку, если request_ids=False
+        или amo его не вернул) ответ сопоставляется с сущностями;
+        embedded - ключ списка в _embedded ответа (по умолчанию последняя часть url).
+        Возвращает ({ключ: сущность из ответа}, {ключ: ошибка}). Пачку, которую
+        amo отверг как невалидную (400), делим пополам, чтобы найти виноватые.
+        """
+        results, errors = {}, {}
+        keys = list(items)
+        chunks = [
+            keys[start : start + self.BATCH_LIMIT]
+            for start in range(0, len(keys), self.BATCH_LIMIT)
+        ]
+        while chunks:
+            chunk = chunks.pop(0)
+            payload = [
+                {**items[key], "request_id": str(key)} if request_ids else items[key]
+                for key in chunk
+            ]
+            try:
+                response = self._request(method, url, json=payload)
+                response.raise_for_status()
+            except requests.HTTPError as error:
+                if error.response.status_code == 400 and len(chunk) > 1:
+                    middle = len(chunk) // 2
+                    chunks[:0] = [chunk[:middle], chunk[middle:]]
+                else:
+                    errors.update({key: error for key in chunk})
+                continue
+            except Exception as error:
+                errors.update({key: error for key in chunk})
+                continue
+            entity_type = embedded or url.rstrip("/").rsplit("/", 1)[-1]
+            entities = response.json().get("_embedded", {}).get(entity_type, [])
+            by_request_id = {str(entity.get("request_id")): entity for entity in entities}
+            for position, key in enumerate(chunk):
+                entity = by_request_id.get(str(key))
+                if entity is None and position < len(entities):
+                    entity = entities[position]
+                if entity is None:
+                    errors[key] = ValueError(f"amo не вернул сущность {key}")
+                else:
+                    results[key] = entity
+        return results, errors
+
     # Общие методы для всех сущностей
     def get_statuses(self):
         url = f"{self.base_url}/leads/pipelines"
-        response = requests.get(url, headers=self._get_headers())
+        response = self._request("GET", url)
         response.raise_for_status()
         return response.json()
 
     def get_managers(self):
         url = f"{self.base_url}/users"
-        response = requests.get(url, headers=self._get_headers())
+        response = self._request("GET", url)
         response.raise_for_status()
         return response.json()
 
+    @staticmethod
+    def _link_data(to_type: str, to_id: int, metadata: Optional[dict] = None) -> dict:
+        data = {"to_entity_id": to_id, "to_entity_type": to_type}
+        if metadata:
+            data["metadata"] = LinkMetadataModel.model_validate(metadata).model_dump(
+                exclude_none=True
+            )
+        return data
+
     def link_entity(
         self,
         to_type: str,
@@ -53,12 +148,33 @@ class AmoCRMClient:
         e_type - leads | contacts | companies | customers
         to_type - leads | contacts | companies | customers | catalog_elements
         """
-        payload = [{"to_entity_id": to_id, "to_entity_type": to_type}]
-        if metadata:
-            payload["metadata"] = LinkMetadataModel.model_validate(
-                metadata
-            ).model_dump()
-        return self.session.post(f"{self.base_url}/{e_type}/{e_id}/link", json=payload)
+        payload = [self._link_data(to_type, to_id, metadata)]
+        return self._request(
+            "POST", f"{self.base_url}/{e_type}/{e_id}/link", json=payload
+        )
+
+    def link_entities(self, e_type: str, links: dict) -> tuple[set, dict]:
+        """
+        Привязки пачками через POST /{e_type}/link:
+        links - {ключ: {"e_id", "to_type", "to_id", "metadata"?}}.
+        Возвращает (ключи привязанных, {ключ: ошибка}).
+        """
+        results, errors = self._batch(
+            "POST",
+            f"{self.base_url}/{e_type}/link",
+            {
+                key: {
+                    "entity_id": link["e_id"],
+                    **self._link_data(
+                        link["to_type"], link["to_id"], link.get("metadata")
+                    ),
+                }
+                for key, link in links.items()
+            },
+            embedded="links",
+            request_ids=False,
+        )
+        return set(results), errors
 
 
 class DealClient(AmoCRMClient):
@@ -66,22 +182,34 @@ class DealClient(AmoCRMClient):
     Класс для работы со сделками в amoCRM.
     """
 
-    def create_deal(
-        self, name, status_id, responsible_user_id=None, price=None, custom_fields=None
-    ):
-        url = f"{self.base_url}/leads"
-        data = {
-            "name": name,
-            "status_id": status_id,
-        }
+    @staticmethod
+    def _lead_data(
+        name=None,
+        status_id=None,
+        responsible_user_id=None,
+        price=None,
+        custom_fields=None,
+    ) -> dict:
+        data = {}
+        if name is not None:
+            data["name"] = name
+        if status_id is not None:
+            data["status_id"] = status_id
         if responsible_user_id is not None:
             data["responsible_user_id"] = responsible_user_id
         if price is not None:
             data["price"] = price
         if custom_fields is not None:
             data["custom_fields_values"] = custom_fields
+        return data
 
-        response = requests.post(url, headers=self._get_headers(), json=[data])
+    def create_deal(
+        self, name, status_id, responsible_user_id=None, price=None, custom_fields=None
+    ):
+        url = f"{self.base_url}/leads"
+        data = self._lead_data(name, status_id, responsible_user_id, price, custom_fields)
+
+        response = self._request("POST", url, json=[data])
         if response.status_code != 200:
             print(response.json())
         response.raise_for_status()
@@ -97,25 +225,52 @@ class DealClient(AmoCRMClient):
         custom_fields=None,
     ):
         url = f"{self.base_url}/leads/{id}"
-        data = {}
-        if name is not None:
-            data["name"] = name
-        if status_id is not None:
-            data["status_id"] = status_id
-        if responsible_user_id is not None:
-            data["responsible_user_id"] = responsible_user_id
-        if price is not None:
-            data["price"] = price
-        if custom_fields is not None:
-            data["custom_fields_values"] = custom_fields
+        data = self._lead_data(name, status_id, responsible_user_id, price, custom_fields)
 
-        response = requests.patch(url, headers=self._get_headers(), json=data)
+        response = self._request("PATCH", url, json=data)
         response.raise_for_status()
         return response.json()
 
+    def create_deals(self, leads: dict) -> tuple[dict, dict]:
+        """
+        Создает сделки пачками: leads - {ключ: аргументы create_deal}.
+        Возвращает ({ключ: id сделки в amo}, {ключ: ошибка}).
+        """
+        results, errors = self._batch(
+            "POST",
+            f"{self.base_url}/leads",
+            {key: self._lead_data(**lead) for key, lead in leads.items()},
+        )
+        return {key: lead["id"] for key, lead in results.items()}, errors
+
+    def update_deals(self, leads: dict) -> tuple[set, dict]:
+        """
+        Обновляет сделки пачками: leads - {id сделки: аргументы update_deal}.
+        Возвращает (id обновленных сделок, {id сделки: ошибка}).
+        """
+        results, errors = self._batch(
+            "PATCH",
+            f"{self.base_url}/leads",
+            {
+                lead_id: {"id": lead_id, **self._lead_data(**lead)}
+                for lead_id, lead in leads.items()
+            },
+        )
+        return set(results), errors
+
+    def find_deals(self, query: str) -> list[dict]:
+        """Сделки, найденные поиском amo по query (имя, значения полей)."""
+        response = self._request(
+            "GET", f"{self.base_url}/leads", params={"query": query, "limit": 250}
+        )
+        response.raise_for_status()
+        if response.status_code == 204:
+            return []
+        return response.json().get("_embedded", {}).get("leads", [])
+
     def delete_deal(self, deal_id):
         url = f"{self.base_url}/leads/{deal_id}"
-        response = requests.delete(url, headers=self._get_headers())
+        response = self._request("DELETE", url)
         response.raise_for_status()
         if response.status_code == 204:
             return {"message": "Deal deleted successfully"}
@@ -128,19 +283,28 @@ class ContactClient(AmoCRMClient):
     Класс для работы с контактами в amoCRM.
     """
 
-    def create_contact(
-        self, name, responsible_user_id=None, custom_fields=None, company_id=None
-    ):
-        url = f"{self.base_url}/contacts"
-        data = {"name": name}
+    @staticmethod
+    def _contact_data(
+        name=None, responsible_user_id=None, custom_fields=None, company_id=None
+    ) -> dict:
+        data = {}
+        if name:
+            data["name"] = name
         if responsible_user_id:
             data["responsible_user_id"] = responsible_user_id
         if custom_fields:
             data["custom_fields_values"] = custom_fields
         if company_id:
             data["company_id"] = company_id
+        return data
 
-        response = requests.post(url, headers=self._get_headers(), json=[data])
+    def create_contact(
+        self, name, responsible_user_id=None, custom_fields=None, company_id=None
+    ):
+        url = f"{self.base_url}/contacts"
+        data = self._contact_data(name, responsible_user_id, custom_fields, company_id)
+
+        response = self._request("POST", url, json=[data])
         response.raise_for_status()
         return response.json()
 
@@ -153,23 +317,42 @@ class ContactClient(AmoCRMClient):
         company_id=None,
     ):
         url = f"{self.base_url}/contacts/{contact_id}"
-        data = {}
-        if name:
-            data["name"] = name
-        if responsible_user_id:
-            data["responsible_user_id"] = responsible_user_id
-        if custom_fields:
-            data["custom_fields_values"] = custom_fields
-        if company_id:
-            data["company_id"] = company_id
+        data = self._contact_data(name, responsible_user_id, custom_fields, company_id)
 
-        response = requests.patch(url, headers=self._get_headers(), json=data)
+        response = self._request("PATCH", url, json=data)
         response.raise_for_status()
         return response.json()
 
+    def create_contacts(self, contacts: dict) -> tuple[dict, dict]:
+        """
+        Создает контакты пачками: contacts - {ключ: аргументы create_contact}.
+        Возвращает ({ключ: id контакта в amo}, {ключ: ошибка}).
+        """
+        results, errors = self._batch(
+            "POST",
+            f"{self.base_url}/contacts",
+            {key: self._contact_data(**contact) for key, contact in contacts.items()},
+        )
+        return {key: contact["id"] for key, contact in results.items()}, errors
+
+    def update_contacts(self, contacts: dict) -> tuple[set, dict]:
+        """
+        Обновляет контакты пачками: contacts - {id контакта: аргументы update_contact}.
+        Возвращает (id обновленных контактов, {id контакта: ошибка}).
+        """
+        results, errors = self._batch(
+            "PATCH",
+            f"{self.base_url}/contacts",
+            {
+                contact_id: {"id": contact_id, **self._contact_data(**contact)}
+                for contact_id, contact in contacts.items()
+            },
+        )
+        return set(results), errors
+
     def delete_contact(self, contact_id):
         url = f"{self.base_url}/contacts/{contact_id}"
-        response = requests.delete(url, headers=self._get_headers())
+        response = self._request("DELETE", url)
         response.raise_for_status()
         if response.status_code == 204:
             return {"message": "Contact deleted successfully"}
@@ -188,7 +371,7 @@ class CompanyClient(AmoCRMClient):
         if custom_fields:
             data["custom_fields_values"] = custom_fields
 
-        response = requests.post(url, headers=self._get_headers(), json=[data])
+        response = self._request("POST", url, json=[data])
         response.raise_for_status()
         return response.json()
 
@@ -204,15 +387,64 @@ class CompanyClient(AmoCRMClient):
         if custom_fields:
             data["custom_fields_values"] = custom_fields
 
-        response = requests.patch(url, headers=self._get_headers(), json=data)
+        response = self._request("PATCH", url, json=data)
         response.raise_for_status()
         return response.json()
 
     def delete_company(self, company_id):
         url = f"{self.base_url}/companies/{company_id}"
-        response = requests.delete(url, headers=self._get_headers())
+        response = self._request("DELETE", url)
         response.raise_for_status()
         if response.status_code == 204:
             return {"message": "Company deleted successfully"}
         else:
             return response.json()
+
+
+def _session() -> requests.Session:
+    """Keep-alive сессия с пулом соединений к amo."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.AMO_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.AMO_HTTP_POOL_MAXSIZE,
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+_sessions: dict[str, requests.Session] = {}
+_clients: dict[tuple, AmoCRMClient] = {}
+_clients_pid = os.getpid()
+_clients_lock = threading.Lock()
+
+
+def get_client(client_class: type[AmoCRMClient], token: str, subdomain: str):
+    """
+    Клиент amo аккаунта из реестра процесса, создается при первом обращении.
+    Клиенты одного аккаунта делят одну сессию; сменился токен - подменяется
+    в клиенте. После fork (gunicorn, celery prefork) пул родителя не переиспользуется.
+    """
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _sessions.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get((client_class, subdomain))
+        if client is None:
+            session = _sessions.get(subdomain)
+            if session is None:
+                session = _sessions[subdomain] = _session()
+            client = client_class(token, subdomain, session=session)
+            _clients[(client_class, subdomain)] = client
+        elif client.token != token:
+            client.token = token
+        return client
+
+
+def close_clients():
+    with _clients_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _clients.clear()
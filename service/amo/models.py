@@ -1,6 +1,12 @@
 import json
 from django.db import models
-from .amo_client import AmoCRMClient, DealClient, CompanyClient, ContactClient
+from .amo_client import (
+    AmoCRMClient,
+    DealClient,
+    CompanyClient,
+    ContactClient,
+    get_client,
+)
 
 
 class AmoAccount(models.Model):
@@ -25,16 +31,16 @@ class AmoAccount(models.Model):
         verbose_name_plural = "Аккаунты AmoCRM"
 
     def get_amo_client(self):
-        return AmoCRMClient(self.token, self.suburl)
+        return get_client(AmoCRMClient, self.token, self.suburl)
     
     def get_deal_client(self):
-        return DealClient(self.token, self.suburl)
+        return get_client(DealClient, self.token, self.suburl)
     
     def get_contact_client(self):
-        return ContactClient(self.token, self.suburl)
+        return get_client(ContactClient, self.token, self.suburl)
     
     def get_company_client(self):
-        return CompanyClient(self.token, self.suburl)
+        return get_client(CompanyClient, self.token, self.suburl)
     
     def get_config(self) -> dict:
         return json.loads(self.config)
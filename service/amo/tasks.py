@@ -1,12 +1,13 @@
 from celery import shared_task
 from .models import AmoAccount, Status, Manager
-from .amo_client import AmoCRMClient
+from utils.rate_limit import background_priority
 
 
 @shared_task
+@background_priority()
 def sync_amo_data():
     for amo_account in AmoAccount.objects.all():
-        client = AmoCRMClient(token=amo_account.token, subdomain=amo_account.suburl)
+        client = amo_account.get_amo_client()
 
         statuses_data = client.get_statuses()
         existing_status_ids = Status.objects.filter(
@@ -1,7 +1,15 @@
 from django.contrib import admin
-from .models import BazonAccount, SaleDocument, Contractor
+from .models import (
+    BazonAccount,
+    SaleDocument,
+    Contractor,
+    SaleDocumentSyncState,
+    CatalogStorage,
+    AmoOutbox,
+)
 
 admin.site.register(BazonAccount)
+admin.site.register(SaleDocumentSyncState)
 
 
 @admin.register(SaleDocument)
@@ -21,3 +29,30 @@ class SaleDocumentAdmin(admin.ModelAdmin):
 class ContractorAdmin(admin.ModelAdmin):
     list_display = ("internal_id", "amo_account", "name", "amo_id", "amo_account")
     list_filter = ("amo_account",)
+
+
+@admin.register(CatalogStorage)
+class CatalogStorageAdmin(admin.ModelAdmin):
+    list_display = ("bazon_account", "storage_id", "max_seen_id", "synced_at")
+    list_filter = ("bazon_account",)
+    # Курсоры ведет catalog_polling, вручную задается только сам склад
+    readonly_fields = (
+        "max_seen_id",
+        "sweep_offset",
+        "sweep_started_at",
+        "previous_sweep_started_at",
+        "synced_at",
+    )
+
+
+@admin.register(AmoOutbox)
+class AmoOutboxAdmin(admin.ModelAdmin):
+    list_display = (
+        "kind",
+        "dedupe_key",
+        "amo_account",
+        "status",
+        "attempts",
+        "available_at",
+    )
+    list_filter = ("status", "kind", "amo_account")
@@ -1,2 +1,9 @@
-from .sale_documents import on_create_sale_document, on_update_sale_document
-from .contractors import on_create_contractor, on_update_contractor
+from .sale_documents import (
+    enqueue_lead_update,
+    enqueue_lead_updates,
+    on_create_sale_document,
+    on_update_sale_document,
+    sync_sale_contractor,
+    sync_sale_contractors,
+)
+from .contractors import on_create_contractor, on_update_contractor, normalize_contractor
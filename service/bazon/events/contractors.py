@@ -1,11 +1,10 @@
-from click.core import batch
-from amo.amo_client import ContactClient
-from bazon.models import Contractor, BazonAccount
 from amo.models import AmoAccount
+from bazon.models import AmoOutbox, Contractor, BazonAccount
+from bazon.outbox import enqueue
+from django.db import transaction
 from pydantic import BaseModel, Field
 from loguru import logger
 import json
-from utils.transaction import transaction_decorator
 
 
 class _Contractor(BaseModel):
@@ -20,25 +19,13 @@ class _Contractor(BaseModel):
     balance: int
 
 
-def on_create_contractor(
-    amo_account: AmoAccount,
-    bazon_account: BazonAccount,
-    contractor: Contractor = None,
-    contractor_data: dict = None,
-):
-    if contractor_data is not None:
-        logger.debug(
-            f"contractor_data: {_Contractor.model_validate(contractor_data).model_dump()}"
-        )
+def normalize_contractor(contractor_data: dict) -> dict:
+    """Контрагент external-api -> поля Contractor (id -> internal_id)."""
+    return _Contractor.model_validate(contractor_data).model_dump()
 
-    if contractor is None:
-        contractor = Contractor.objects.create(
-            amo_account=amo_account,
-            **_Contractor.model_validate(contractor_data).model_dump(),
-            bazon_account=bazon_account,
-        )
 
-    api = ContactClient(amo_account.token, amo_account.suburl)
+def contact_payload(amo_account: AmoAccount, contractor: Contractor) -> dict:
+    """Контрагент -> аргументы create_contact/update_contact."""
     custom_fields = []
 
     def append_value(field_id: int, value: str):
@@ -47,101 +34,63 @@ def on_create_contractor(
     amo_config = json.loads(amo_account.config)
     if (
         contact_phone_field := amo_config.get("contact_phone_field")
-    ) and contractor.phone != "":
+    ) and contractor.phone:
         append_value(contact_phone_field, contractor.phone)
     if (
         contact_email_id := amo_config.get("contact_email_field")
-    ) and contractor.email != "":
+    ) and contractor.email:
         append_value(contact_email_id, contractor.email)
-
-    logger.debug(
-        f"Перед созданием контакта, данные: {contractor.name} , {custom_fields}"
+    return {"name": contractor.name, "custom_fields": custom_fields}
+
+
+def enqueue_contact_upsert(amo_account: AmoAccount, contractor: Contractor):
+    enqueue(
+        amo_account,
+        AmoOutbox.UPSERT_CONTACT,
+        f"contact:{contractor.pk}",
+        {
+            "contractor_id": contractor.pk,
+            "contact": contact_payload(amo_account, contractor),
+        },
     )
 
-    try:
-        amo_contact = (
-            api.create_contact(contractor.name, custom_fields=custom_fields).get(
-                "_embedded", {}
-            )
-        ).get("contacts", [None])[0]
-
-        logger.debug(f"Создан контакт {amo_contact}")
 
-    except Exception as error:
-
-        logger.error(f"Error create contact: {error} {custom_fields}")
-        return
-
-    if amo_contact is None:
-        return
-    contractor.amo_id = amo_contact.get("id")
-    contractor.save()
+def on_create_contractor(
+    amo_account: AmoAccount,
+    bazon_account: BazonAccount,
+    contractor: Contractor = None,
+    contractor_data: dict = None,
+):
+    with transaction.atomic():
+        if contractor is None:
+            contractor = Contractor.objects.create(
+                amo_account=amo_account,
+                **normalize_contractor(contractor_data),
+                bazon_account=bazon_account,
+            )
+        enqueue_contact_upsert(amo_account, contractor)
+    logger.debug(f"Контакт {contractor.name} поставлен в очередь на создание")
     return contractor
 
 
 def on_update_contractor(
     contractor_data: dict, amo_account: AmoAccount, bazon_account: BazonAccount
 ):
-    logger.debug(
-        f"UPDATE contractor_data: {_Contractor.model_validate(contractor_data).model_dump()}"
-    )
-    validated_contractor_data = _Contractor.model_validate(contractor_data).model_dump()
-    contractor = Contractor.objects.get(
-        amo_account=amo_account,
-        internal_id=validated_contractor_data.get("internal_id"),
-    )
-    contact_amo_id = contractor.amo_id
-    contractor.delete()
-    if contact_amo_id is None:
-        contractor = on_create_contractor(
-            contractor_data=validated_contractor_data,
+    validated_contractor_data = normalize_contractor(contractor_data)
+    with transaction.atomic():
+        contractor, created = Contractor.objects.select_for_update().get_or_create(
             amo_account=amo_account,
-            bazon_account=bazon_account,
+            internal_id=validated_contractor_data.pop("internal_id"),
+            defaults={**validated_contractor_data, "bazon_account": bazon_account},
         )
-    else:
-        contractor = Contractor.objects.create(
-            amo_account=amo_account,
-            **validated_contractor_data,
-            bazon_account=bazon_account,
-            amo_id=contact_amo_id,
-        )
-
-    api = ContactClient(amo_account.token, amo_account.suburl)
-
-    custom_fields = []
-    def append_value(field_id: int, value: str):
-        custom_fields.append({"field_id": field_id, "values": [{"value": value}]})
-
-    amo_config = json.loads(amo_account.config)
-    if (
-        contact_phone_field := amo_config.get("contact_phone_field")
-    ) and contractor.phone != "":
-        append_value(contact_phone_field, contractor.phone)
-    if (
-        contact_email_id := amo_config.get("contact_email_field")
-    ) and contractor.email != "":
-        append_value(contact_email_id, contractor.email)
-
-    logger.debug(
-        f"Перед созданием контакта, данные: {contractor.name} , {custom_fields}"
-    )
-
-    try:
-        amo_contact = (
-            api.update_contact(contractor.amo_id, custom_fields=custom_fields).get(
-                "_embedded", {}
-            )
-        ).get("contacts", [None])[0]
-
-        logger.debug(f"Обновлен контакт {amo_contact}")
-
-    except Exception as error:
-
-        logger.error(f"Ошибка в обновлении контакта: {error} {custom_fields}")
-        return
-
-    if amo_contact is None:
-        return
-    contractor.amo_id = amo_contact.get("id")
-    contractor.save()
+        if not created:
+            fingerprint = contractor.fingerprint
+            for name, value in validated_contractor_data.items():
+                setattr(contractor, name, value)
+            contractor.save()
+            # В amo уже актуальные данные
+            if contractor.amo_id and contractor.fingerprint == fingerprint:
+                return contractor
+        enqueue_contact_upsert(amo_account, contractor)
+    logger.debug(f"Контакт {contractor.name} поставлен в очередь на обновление")
     return contractor
@@ -1,85 +1,176 @@
 from utils.serializers import BazonSaleToAmoLeadSerializer
-from bazon.models import BazonAccount
-from amo.models import AmoAccount
-from amo.amo_client import DealClient
-from bazon.models import SaleDocument, Contractor
+from amo.models import AmoAccount, Manager, Status
+from bazon.models import AmoOutbox, SaleDocument, Contractor
+from bazon.outbox import enqueue, enqueue_many, merge_pending_many
 from .contractors import on_create_contractor, on_update_contractor
+from django.conf import settings
 from django.db import transaction
 from loguru import logger
-from amo.amo_client import AmoCRMClient
 
 
-def create_deal(sale_data: dict, amo_account: AmoAccount):
+def lead_lookups(amo_account: AmoAccount) -> dict:
+    """
+    Статусы и менеджеры amo-аккаунта для BazonSaleToAmoLeadSerializer:
+    два запроса на пачку сделок вместо запросов на каждую.
+    При дублях берется первая запись, как .first() в сериализаторе.
+    """
+    statuses = Status.objects.filter(
+        amo_account=amo_account, bazon_status__isnull=False
+    ).order_by("-pk")
+    managers = Manager.objects.filter(
+        amo_account=amo_account, bazon_id__isnull=False
+    ).order_by("-pk")
+    return {
+        "statuses": dict(statuses.values_list("bazon_status", "amo_id")),
+        "managers": dict(managers.values_list("bazon_id", "amo_id")),
+    }
+
+
+def lead_payload(
+    sale_data: dict, amo_account: AmoAccount, lookups: dict | None = None
+) -> dict:
+    """Сделка Bazon -> аргументы create_deal/update_deal (без id сделки)."""
+    serializer = BazonSaleToAmoLeadSerializer(
+        amo_account, sale_data, with_id=False, **(lookups or {})
+    )
+    serializer.serialize()
+    return serializer.get_serialized_data(with_id=False)
+
+
+def enqueue_lead_updates(
+    changes: list[tuple[SaleDocument, dict]], amo_account: AmoAccount
+):
+    """
+    Обновление сделок в amo. Пока сделка не создана - дописывается в создание.
+    Обновления одной сделки amo копятся AMO_LEAD_UPDATE_DEBOUNCE секунд
+    и уходят одним PATCH с последним состоянием. Ключ - документ, а не id
+    сделки: он не меняется, когда сделка создается.
+    Очередь пишется несколькими запросами на всю пачку (см. enqueue_many).
+    """
+    lookups = lead_lookups(amo_account)
+    leads = {
+        sale_document.pk: lead_payload(sale_data, amo_account, lookups)
+        for sale_document, sale_data in changes
+    }
     with transaction.atomic():
-        sale_document = SaleDocument.objects.create(
-            amo_account=amo_account, **sale_data
+        merged = merge_pending_many(
+            amo_account,
+            {
+                f"lead:create:{sale_document.pk}": {"lead": leads[sale_document.pk]}
+                for sale_document, _ in changes
+                if not sale_document.amo_lead_id
+            },
+        )
+        enqueue_many(
+            amo_account,
+            AmoOutbox.UPDATE_LEAD,
+            {
+                f"lead:{sale_document.pk}": {
+                    "sale_document_id": sale_document.pk,
+                    "lead": leads[sale_document.pk],
+                }
+                for sale_document, _ in changes
+                if f"lead:create:{sale_document.pk}" not in merged
+            },
+            delay=settings.AMO_LEAD_UPDATE_DEBOUNCE,
+            max_delay=settings.AMO_LEAD_UPDATE_MAX_DELAY,
         )
-        serializer = BazonSaleToAmoLeadSerializer(amo_account, sale_data)
-        serializer.serialize()
-        serialized_data = serializer.get_serialized_data(with_id=False)
-        amo_client = DealClient(amo_account.token, amo_account.suburl)
-        response = amo_client.create_deal(**serialized_data)
-        amo_lead_id = response["_embedded"]["leads"][0]["id"]
-        sale_document.amo_lead_id = amo_lead_id
-        sale_document.amo_account = amo_account
-        sale_document.save()
 
 
-def on_create_sale_document(sale_data: dict, amo_account: AmoAccount):
-    create_deal(sale_data=sale_data, amo_account=amo_account)
-    query = SaleDocument.objects.filter(
-        internal_id=sale_data.get("internal_id"), amo_account=amo_account
-    )
-    if not query.exists():
-        logger.error(
-            f"Транзакция создания сделки закончилась с ошибкой.\nsale_data={sale_data}\namo_account={amo_account}"
-        )
-        return
+def enqueue_lead_update(
+    sale_document: SaleDocument, sale_data: dict, amo_account: AmoAccount
+):
+    enqueue_lead_updates([(sale_document, sale_data)], amo_account)
 
-    sale_document = query.first()
 
-    if sale_document.contractor_id:
-        if sale_document.contractor_id == 1:
-            return
-        api = sale_document.get_api()
-        contractor_response = api.get_contractor(sale_document.contractor_id)
-        contractor_json = (
-            contractor_response.json()
-            .get("response", {})
-            .get("getContractor", {})
-            .get("Contractor")
+def create_deal(sale_data: dict, amo_account: AmoAccount) -> SaleDocument:
+    with transaction.atomic():
+        sale_document = SaleDocument.objects.create(
+            amo_account=amo_account, **sale_data
         )
-        if contractor_json is None:
-            return
-        query = Contractor.objects.filter(
-            internal_id=sale_document.contractor_id, amo_account=amo_account
+        enqueue(
+            amo_account,
+            AmoOutbox.CREATE_LEAD,
+            f"lead:create:{sale_document.pk}",
+            {
+                "sale_document_id": sale_document.pk,
+                "lead": lead_payload(sale_data, amo_account),
+            },
         )
-        if not query.exists():
-            on_create_contractor(
-                contractor_data=contractor_json,
-                bazon_account=sale_document.bazon_account,
-                amo_account=sale_document.amo_account,
+    return sale_document
+
+
+def sync_sale_contractors(
+    sale_documents: list[SaleDocument], amo_account: AmoAccount, raise_errors=False
+) -> set:
+    """
+    Контрагенты сделок из Bazon -> контакты в amo, привязанные к сделкам.
+    Каждый контрагент запрашивается в Bazon один раз на пачку, привязки
+    ставятся в очередь одним enqueue_many. Возвращает internal_id сделок,
+    контрагента которых синхронизировать не удалось.
+    """
+    by_contractor = {}
+    for sale_document in sale_documents:
+        if sale_document.contractor_id and sale_document.contractor_id != 1:
+            by_contractor.setdefault(sale_document.contractor_id, []).append(
+                sale_document
             )
-        contractor: Contractor = query.first()
-        if not contractor.amo_id:
-            return
+    if not by_contractor:
+        return set()
+
+    bazon_account = sale_documents[0].bazon_account
+    api = bazon_account.get_api()
+    known = set(
+        Contractor.objects.filter(
+            amo_account=amo_account, internal_id__in=by_contractor
+        ).values_list("internal_id", flat=True)
+    )
+    links, failed = {}, set()
+    for contractor_id, documents in by_contractor.items():
+        try:
+            contractor_response = api.get_contractor(contractor_id)
+            contractor_json = contractor_response.result("getContractor").get(
+                "Contractor"
+            )
+            if contractor_json is None:
+                continue
+            if contractor_id in known:
+                contractor = on_update_contractor(
+                    contractor_json,
+                    bazon_account=bazon_account,
+                    amo_account=amo_account,
+                )
+            else:
+                contractor = on_create_contractor(
+                    contractor_data=contractor_json,
+                    bazon_account=bazon_account,
+                    amo_account=amo_account,
+                )
+        except Exception as error:
+            if raise_errors:
+                raise
+            logger.error(f"Контрагент {contractor_id} не синхронизирован: {error}")
+            failed.update(document.internal_id for document in documents)
+            continue
+        for document in documents:
+            links[f"link:{document.pk}:{contractor.pk}"] = {
+                "sale_document_id": document.pk,
+                "contractor_id": contractor.pk,
+            }
 
-        amo_client: AmoCRMClient = amo_account.get_amo_client()
+    enqueue_many(amo_account, AmoOutbox.LINK_CONTACT, links)
+    logger.debug(f"Контакты поставлены в очередь на привязку к сделкам: {len(links)}")
+    return failed
 
-        response = amo_client.link_entity(
-            to_type="contacts",
-            to_id=contractor.amo_id,
-            e_id=sale_document.amo_lead_id,
-            e_type="leads",
-        )
-        if response.status_code != 200:
-            logger.error(
-                f"Ошибка в линковке контакта к сделке, ответ от амо: {response.text}"
-            )
-            return
-        logger.debug(
-            f"Контакт {contractor.amo_id} прилинкован к сделке {sale_document.amo_lead_id}"
-        )
+
+def sync_sale_contractor(sale_document: SaleDocument, amo_account: AmoAccount):
+    """Контрагент сделки из Bazon -> контакт в amo, привязанный к сделке."""
+    sync_sale_contractors([sale_document], amo_account, raise_errors=True)
+
+
+def on_create_sale_document(sale_data: dict, amo_account: AmoAccount):
+    sale_document = create_deal(sale_data=sale_data, amo_account=amo_account)
+    sync_sale_contractor(sale_document, amo_account)
 
 
 def on_update_sale_document(
@@ -93,73 +184,11 @@ def on_update_sale_document(
 
     logger.debug(f"Начало обновления сделки {sale_data}")
     if sale_data is not None:
-        serializer = BazonSaleToAmoLeadSerializer(amo_account, sale_data)
-        serializer.serialize()
-        serialized_data = serializer.get_serialized_data(with_id=True)
-        amo_client = DealClient(amo_account.token, amo_account.suburl)
-
-        if serialized_data.get("id") is None:
-            return
-        logger.debug(f"Обновляю сделку в амо: {serialized_data}")
-        response = amo_client.update_deal(**serialized_data)
-
         sale_document = SaleDocument.objects.filter(
-            amo_lead_id=(serialized_data.get("id"))
+            internal_id=sale_data.get("internal_id"), amo_account=amo_account
         ).first()
-    if sale_document.contractor_id:
-        if sale_document.contractor_id == 1:
+        if sale_document is None:
             return
-        api = sale_document.get_api()
-        contractor_response = api.get_contractor(sale_document.contractor_id)
-        contractor_json = (
-            contractor_response.json()
-            .get("response", {})
-            .get("getContractor", {})
-            .get("Contractor")
-        )
-        if contractor_json is None:
-            return
-        query = Contractor.objects.filter(
-            internal_id=sale_document.contractor_id, amo_account=amo_account
-        )
-        if not query.exists():
-            on_create_contractor(
-                contractor_data=contractor_json,
-                bazon_account=sale_document.bazon_account,
-                amo_account=sale_document.amo_account,
-            )
-            amo_client: AmoCRMClient = amo_account.get_amo_client()
-
-            contractor: Contractor = query.first()
-            response = amo_client.link_entity(
-                to_type="contacts",
-                to_id=contractor.amo_id,
-                e_id=sale_document.amo_lead_id,
-                e_type="leads",
-            )
-            if response.status_code != 200:
-                logger.error(
-                    f"(обновление сделки) Ошибка в линковке контакта к сделке, ответ от амо: {response.text}"
-                )
-                return
-            if not contractor.amo_id:
-                return
-            logger.debug(
-                f"(Обновление сделки) Контакт {contractor.amo_id} прилинкован к сделке {sale_document.amo_lead_id}"
-            )
-        else:
-            amo_client: AmoCRMClient = amo_account.get_amo_client()
-            contractor: Contractor = query.first()
-            response = amo_client.link_entity(
-                to_type="contacts",
-                to_id=contractor.amo_id,
-                e_id=sale_document.amo_lead_id,
-                e_type="leads",
-            )
-            on_update_contractor(
-                contractor_json,
-                bazon_account=sale_document.bazon_account,
-                amo_account=sale_document.amo_account,
-            )
-
-        logger.debug(f"Обновлен контакт {contractor_json}")
+        with transaction.atomic():
+            enqueue_lead_update(sale_document, sale_data, amo_account)
+    sync_sale_contractor(sale_document, amo_account)
@@ -0,0 +1,226 @@
+import threading
+import time
+import weakref
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django_redis import get_redis_connection
+from loguru import logger
+from rest_framework.exceptions import APIException
+
+
+# Аренды lock key Bazon: "<bazon_account_id>:<internal_id>" -> {"lock_key", "number", "last_used"}
+LEASES_KEY = "bazon:document_leases"
+
+
+class DocumentBusy(APIException):
+    status_code = 409
+    default_detail = "document_busy"
+    default_code = "document_busy"
+
+
+_local_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = (
+    weakref.WeakValueDictionary()
+)
+_local_locks_guard = threading.Lock()
+
+
+def _local_lock(field: str) -> threading.Lock:
+    with _local_locks_guard:
+        lock = _local_locks.get(field)
+        if lock is None:
+            lock = _local_locks[field] = threading.Lock()
+        return lock
+
+
+def is_invalid_lock(error) -> bool:
+    return isinstance(error, APIException) and "invalid_key_lock" in str(error.detail)
+
+
+class DocumentLease:
+    """
+    Аренда lock key документа Bazon вместо пары set_lock_key/drop_lock_key на запрос.
+
+        with sale_document.generate_lock_key() as lock_key:
+            api.edit_sale(sale_document.internal_id, data, lock_key)
+
+    Ключ хранится в Redis и переиспользуется всеми запросами и воркерами,
+    пока документ правят чаще, чем раз в DOCUMENT_LOCK_IDLE_TIMEOUT секунд.
+    Изменения одного документа идут по очереди: локальная блокировка в процессе
+    и блокировка в Redis между процессами. Простаивающий ключ отпускает один
+    на процесс поток _LeaseReaper, страховка - release_idle_leases() в цикле
+    опроса сделок.
+    """
+
+    def __init__(self, sale_document):
+        self.sale_document = sale_document
+        self.field = lease_field(sale_document.bazon_account_id, sale_document.internal_id)
+        self.lock_key = None
+        self._invalid = False
+        self._local = _local_lock(self.field)
+        self._mutex = _mutex(self.field)
+
+    def __enter__(self) -> str:
+        wait = settings.DOCUMENT_LOCK_WAIT_TIMEOUT
+        if not self._local.acquire(timeout=wait):
+            raise DocumentBusy()
+        if not self._mutex.acquire(blocking=True, blocking_timeout=wait):
+            self._local.release()
+            raise DocumentBusy()
+        self._invalid = False
+        try:
+            self.lock_key = self._lease_lock_key()
+        except BaseException:
+            self._release()
+            raise
+        return self.lock_key
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        redis = get_redis_connection("default")
+        try:
+            if self._invalid or is_invalid_lock(exc_val):
+                # Bazon больше не принимает ключ - следующий запрос возьмет новый
+                redis.hdel(LEASES_KEY, self.field)
+            else:
+                redis.hset(LEASES_KEY, self.field, self._dump(self.lock_key))
+                _reaper.schedule(self.sale_document.bazon_account, self.field)
+        finally:
+            self._release()
+
+    def invalidate(self):
+        """Bazon отверг ключ, а ошибку обработали внутри with - не сохранять аренду."""
+        self._invalid = True
+
+    def _lease_lock_key(self) -> str:
+        lease = _load(get_redis_connection("default").hget(LEASES_KEY, self.field))
+        if lease is not None and not _is_idle(lease):
+            return lease["lock_key"]
+
+        # Истекшую аренду никто не отпустил - заменяем ее ключ новым
+        prev_lock_key = lease["lock_key"] if lease is not None else False
+        api = self.sale_document.get_api()
+        lock_key = api.generate_lock_key(self.sale_document.number, prev_lock_key)
+        if lock_key is None:
+            raise APIException(detail="cant_generate_lock_key", code=403)
+        return lock_key
+
+    def _dump(self, lock_key: str) -> bytes:
+        return orjson.dumps(
+            {
+                "lock_key": lock_key,
+                "number": self.sale_document.number,
+                "last_used": time.time(),
+            }
+        )
+
+    def _release(self):
+        try:
+            self._mutex.release()
+        except Exception as error:
+            logger.warning(f"Document lock {self.field}: {error}")
+        self._local.release()
+
+
+def lease_field(bazon_account_id: int, internal_id: int) -> str:
+    return f"{bazon_account_id}:{internal_id}"
+
+
+def _mutex(field: str):
+    return cache.lock(
+        f"bazon:document_lock:{field}", timeout=settings.DOCUMENT_LOCK_MUTATION_TIMEOUT
+    )
+
+
+def _load(raw) -> dict | None:
+    return orjson.loads(raw) if raw else None
+
+
+def _is_idle(lease: dict) -> bool:
+    return lease["last_used"] + settings.DOCUMENT_LOCK_IDLE_TIMEOUT <= time.time()
+
+
+def _release_if_idle(bazon_account, field: str) -> bool:
+    mutex = _mutex(field)
+    # Документ сейчас правят - его отпустит тот, кто правит
+    if not mutex.acquire(blocking=False):
+        return False
+    try:
+        redis = get_redis_connection("default")
+        lease = _load(redis.hget(LEASES_KEY, field))
+        if lease is None or not _is_idle(lease):
+            return False
+        internal_id = int(field.split(":")[1])
+        try:
+            bazon_account.get_api().drop_lock_key(internal_id, lease["lock_key"])
+        except Exception as error:
+            logger.warning(f"Document lock {field}: не удалось отпустить ({error})")
+        redis.hdel(LEASES_KEY, field)
+        return True
+    finally:
+        mutex.release()
+
+
+class _LeaseReaper:
+    """
+    Отпускает простаивающие ключи процесса одним потоком: у документа один срок,
+    каждое изменение его сдвигает, а не заводит свой таймер.
+    """
+
+    def __init__(self):
+        self._due = {}  # field -> (bazon_account, срок по time.monotonic())
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, bazon_account, field: str):
+        # Секунда запаса, чтобы аренда к сроку точно считалась простаивающей
+        due = time.monotonic() + settings.DOCUMENT_LOCK_IDLE_TIMEOUT + 1
+        with self._condition:
+            self._due[field] = (bazon_account, due)
+            # Поток создается лениво: после fork воркера его нужно запустить заново
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="document-lease-reaper", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def _pop_due(self) -> list:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [
+                    (field, bazon_account)
+                    for field, (bazon_account, at) in self._due.items()
+                    if at <= now
+                ]
+                if due:
+                    for field, _ in due:
+                        del self._due[field]
+                    return due
+                next_at = min((at for _, at in self._due.values()), default=None)
+                self._condition.wait(None if next_at is None else next_at - now)
+
+    def _run(self):
+        while True:
+            for field, bazon_account in self._pop_due():
+                try:
+                    _release_if_idle(bazon_account, field)
+                except Exception as error:
+                    logger.warning(f"Document lock {field}: {error}")
+            connections.close_all()
+
+
+_reaper = _LeaseReaper()
+
+
+def release_idle_leases(bazon_account) -> int:
+    """Отпускает простаивающие ключи аккаунта (страховка, если процесс с _LeaseReaper упал)."""
+    redis = get_redis_connection("default")
+    prefix = f"{bazon_account.pk}:"
+    released = 0
+    for field, raw in redis.hgetall(LEASES_KEY).items():
+        field = field.decode()
+        if field.startswith(prefix) and _is_idle(_load(raw)):
+            released += _release_if_idle(bazon_account, field)
+    return released
@@ -0,0 +1,10 @@
+from bazon.outbox import OutboxDispatcher
+from django.core.management.base import BaseCommand
+from utils.rate_limit import background_priority
+
+
+class Command(BaseCommand):
+
+    @background_priority()
+    def handle(self, *args, **options):
+        OutboxDispatcher().run_forever()
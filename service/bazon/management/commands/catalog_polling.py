@@ -0,0 +1,19 @@
+import time
+from django.conf import settings
+from bazon.models import CatalogStorage
+from bazon.polling import CatalogSync
+from django.core.management.base import BaseCommand
+from loguru import logger
+from utils.rate_limit import background_priority
+
+
+class Command(BaseCommand):
+    @background_priority()
+    def handle(self, *args, **options):
+        while True:
+            for storage in CatalogStorage.objects.select_related("bazon_account"):
+                try:
+                    CatalogSync(storage).run_once()
+                except Exception as error:
+                    logger.error(f"Error to sync catalog: {error} ({storage})")
+            time.sleep(settings.CATALOG_POLL_INTERVAL)
@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazon', '0009_alter_bazonaccount_options_alter_contractor_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleDocumentSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_seen_id', models.PositiveIntegerField(default=0)),
+                ('head_digests', models.JSONField(blank=True, default=dict)),
+                ('sweep_offset', models.PositiveIntegerField(default=0)),
+                ('last_sweep_at', models.DateTimeField(blank=True, null=True)),
+                ('bazon_account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sale_documents_sync', to='bazon.bazonaccount')),
+            ],
+            options={
+                'verbose_name': 'Курсор опроса сделок',
+                'verbose_name_plural': 'Курсоры опроса сделок',
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1 on 2026-10-18 13:32
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.deletion
+from django.db import migrations, models
+from utils.migrations import PostgresAddIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazon', '0010_saledocumentsyncstate'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='CatalogStorage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('storage_id', models.PositiveIntegerField()),
+                ('max_seen_id', models.PositiveIntegerField(default=0)),
+                ('sweep_offset', models.PositiveIntegerField(default=0)),
+                ('sweep_started_at', models.DateTimeField(blank=True, null=True)),
+                ('previous_sweep_started_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('bazon_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_storages', to='bazon.bazonaccount')),
+            ],
+            options={
+                'verbose_name': 'Склад каталога',
+                'verbose_name_plural': 'Склады каталога',
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('internal_id', models.PositiveIntegerField()),
+                ('name', models.CharField(blank=True, default='', max_length=512)),
+                ('part_number', models.CharField(blank=True, default='', max_length=255)),
+                ('digest', models.CharField(max_length=16)),
+                ('payload', models.JSONField()),
+                ('synced_at', models.DateTimeField()),
+                ('storage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='bazon.catalogstorage')),
+            ],
+            options={
+                'verbose_name': 'Товар каталога',
+                'verbose_name_plural': 'Товары каталога',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogstorage',
+            constraint=models.UniqueConstraint(fields=('bazon_account', 'storage_id'), name='unique_catalog_storage_per_bazon_account'),
+        ),
+        PostgresAddIndex(
+            model_name='catalogitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='catalog_item_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        PostgresAddIndex(
+            model_name='catalogitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['part_number'], name='catalog_item_part_number_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogitem',
+            constraint=models.UniqueConstraint(fields=('storage', 'internal_id'), name='unique_catalog_item_per_storage'),
+        ),
+    ]
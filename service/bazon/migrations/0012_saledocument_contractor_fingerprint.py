@@ -0,0 +1,69 @@
+# Generated by Django 5.1 on 2026-10-18 13:41
+
+from django.db import migrations, models
+from utils.fingerprint import fingerprint
+
+
+# Списки полей на момент миграции (SALE_DOCUMENT_FINGERPRINT_FIELDS
+# и CONTRACTOR_FINGERPRINT_FIELDS по умолчанию): миграция не должна зависеть
+# от текущих настроек. Если списки в настройках другие, записи один раз
+# обновятся в amo - как после любой смены списка
+SALE_DOCUMENT_FIELDS = (
+    "number",
+    "type",
+    "status",
+    "sum",
+    "storage_id",
+    "contractor_id",
+    "contractor_name",
+    "manager_id",
+    "manager_name",
+)
+CONTRACTOR_FIELDS = (
+    "name",
+    "type",
+    "phone",
+    "email",
+    "manager_comment",
+    "balance_free",
+    "balance_reserve",
+    "balance",
+)
+
+
+def fill_fingerprints(apps, schema_editor):
+    # Иначе первый опрос отправит в amo обновления всех существующих записей
+    for model_name, fields in (
+        ("SaleDocument", SALE_DOCUMENT_FIELDS),
+        ("Contractor", CONTRACTOR_FIELDS),
+    ):
+        model = apps.get_model("bazon", model_name)
+        batch = []
+        for instance in model.objects.only("id", *fields).iterator(chunk_size=1000):
+            instance.fingerprint = fingerprint(vars(instance), fields)
+            batch.append(instance)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ["fingerprint"])
+                batch = []
+        model.objects.bulk_update(batch, ["fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazon', '0011_catalogstorage_catalogitem_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contractor',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='saledocument',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
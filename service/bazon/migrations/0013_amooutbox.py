@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-18 13:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('amo', '__first__'),
+        ('bazon', '0012_saledocument_contractor_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AmoOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('create_lead', 'Создание сделки'), ('update_lead', 'Обновление сделки'), ('upsert_contact', 'Создание/обновление контакта'), ('link_contact', 'Привязка контакта к сделке')], max_length=20)),
+                ('dedupe_key', models.CharField(max_length=255)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('done', 'Отправлено'), ('dead', 'Не отправлено')], default='pending', max_length=10)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('amo_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='amo.amoaccount')),
+            ],
+            options={
+                'verbose_name': 'Запись в AmoCRM',
+                'verbose_name_plural': 'Очередь записей в AmoCRM',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='bazon_amoou_status_d09d41_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('amo_account', 'dedupe_key'), name='unique_pending_outbox_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 13:57
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+from utils.migrations import PostgresAddIndex, PostgresRemoveIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazon', '0013_amooutbox'),
+    ]
+
+    operations = [
+        PostgresRemoveIndex(
+            model_name='catalogitem',
+            name='catalog_item_name_trgm',
+        ),
+        PostgresRemoveIndex(
+            model_name='catalogitem',
+            name='catalog_item_part_number_trgm',
+        ),
+        PostgresAddIndex(
+            model_name='catalogitem',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='catalog_item_name_trgm'),
+        ),
+        PostgresAddIndex(
+            model_name='catalogitem',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('part_number'), name='gin_trgm_ops'), name='catalog_item_part_number_trgm'),
+        ),
+    ]
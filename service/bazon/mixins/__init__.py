@@ -1,3 +1,4 @@
 from .origin_check_mixin import OriginCheckMixin
 from .sale_document_mixin import SaleDocumentMixin
 from .bazon_api_mixin import BazonApiMixin
+from .bulk_items_mixin import BulkItemsMixin
@@ -1,13 +1,19 @@
+from django.http import HttpResponse
 from rest_framework.response import Response
-import requests
+from utils.bazon_api import BazonResponse
 import json
 
 
 class BazonApiMixin:
 
     @staticmethod
-    def return_response(response: requests.Response):
+    def return_response(response: BazonResponse, status: int = None):
+        status = status or response.status_code
         try:
-            return Response(response.json(), status=response.status_code)
+            response.json()
         except json.JSONDecodeError:
-            return Response({"Error": "bazon_api_error"}, status=response.status_code)
+            return Response({"Error": "bazon_api_error"}, status=status)
+        # Тело уже разобрано и проверено - отдаем исходные байты без перекодирования
+        return HttpResponse(
+            response.content, status=status, content_type="application/json"
+        )
@@ -0,0 +1,86 @@
+from django.conf import settings
+from loguru import logger
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_207_MULTI_STATUS,
+    HTTP_400_BAD_REQUEST,
+    HTTP_502_BAD_GATEWAY,
+)
+from bazon.locks import DocumentLease, is_invalid_lock
+
+
+class BulkItemsMixin:
+    """
+    Пакетное изменение позиций документа: все части уходят под одним lock key,
+    по каждой позиции возвращается свой результат.
+    Bazon отвечает на часть целиком, без результата по позициям, поэтому
+    status у всех позиций части общий, а номер части отдается в chunk.
+    """
+
+    @staticmethod
+    def apply_in_chunks(
+        lease: DocumentLease, results: list[dict], payloads: list, send, method: str
+    ):
+        """
+        results[i] - результат позиции payloads[i], в него пишутся status, error
+        и chunk - номер части, с которой позиция ушла в Bazon.
+        send(lock_key, chunk) отправляет часть payloads методом frontend-api method.
+        """
+        chunk_size = settings.BAZON_BULK_CHUNK_SIZE
+        chunks = [
+            range(start, min(start + chunk_size, len(payloads)))
+            for start in range(0, len(payloads), chunk_size)
+        ]
+        if not chunks:
+            return
+
+        with lease as lock_key:
+            for number, chunk in enumerate(chunks):
+                try:
+                    response = send(lock_key, [payloads[index] for index in chunk])
+                    error = (
+                        response.error(method)
+                        if response.status_code == 200
+                        else f"bazon_status_{response.status_code}"
+                    )
+                except APIException as exception:
+                    error = str(exception.detail)
+                    if is_invalid_lock(exception):
+                        lease.invalidate()
+                        # Ключ потерян - остальные части не отправляем
+                        for rest_number, rest in enumerate(chunks[number:], number):
+                            for index in rest:
+                                results[index].update(
+                                    status="error", error=error, chunk=rest_number + 1
+                                )
+                        return
+                for index in chunk:
+                    results[index]["chunk"] = number + 1
+                    if error:
+                        results[index].update(status="error", error=error)
+                    else:
+                        results[index]["status"] = "ok"
+                if error:
+                    logger.error(f"{method}: часть {number + 1}/{len(chunks)} - {error}")
+
+    @staticmethod
+    def bulk_response(results: list[dict]) -> Response:
+        """
+        200 - все позиции ok, 207 - часть ok, остальные skipped или error;
+        ни одной ok: 502, если отказал Bazon, 400 - если все позиции пропущены
+        или их нет.
+        """
+        statuses = {result.get("status") for result in results}
+        if not results:
+            status = HTTP_400_BAD_REQUEST
+        elif statuses <= {"ok"}:
+            status = HTTP_200_OK
+        elif "ok" in statuses:
+            status = HTTP_207_MULTI_STATUS
+        elif "error" in statuses:
+            status = HTTP_502_BAD_GATEWAY
+        else:
+            status = HTTP_400_BAD_REQUEST
+        return Response({"items": results}, status=status)
@@ -1,6 +1,13 @@
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from utils.bazon_api import Bazon
-from rest_framework.exceptions import APIException
+from utils.fingerprint import fingerprint
+from .tokens import BazonTokenManager
+from .reference import BazonReference
+from .locks import DocumentLease
 
 
 class BazonAccount(models.Model):
@@ -10,10 +17,17 @@ class BazonAccount(models.Model):
     refresh_token = models.TextField(null=True, blank=True)
     access_token = models.TextField(null=True, blank=True)
 
+    def get_token_manager(self) -> BazonTokenManager:
+        return BazonTokenManager(self)
+
+    def get_reference(self) -> BazonReference:
+        return BazonReference(self)
+
     def get_api(self) -> Bazon:
-        if self.access_token is None or self.refresh_token is None:
+        tokens = self.get_token_manager().get_tokens()
+        if tokens is None:
             return None
-        bazon = Bazon(self.login, self.password, self.refresh_token, self.access_token)
+        bazon = Bazon(self.login, self.password, tokens["RT"], tokens["AT"])
         return bazon
 
     def auth(self):
@@ -21,12 +35,12 @@ class BazonAccount(models.Model):
         self.refresh_token = bazon.get_refresh_token()
         self.access_token = bazon.get_access_token()
 
-    def refresh_auth(self):
-        bazon = Bazon(login=self.login, password=self.password)
-        bazon.refresh_me()
-        self.refresh_token = bazon.get_refresh_token()
-        self.access_token = bazon.get_access_token()
-        self.save()
+    def refresh_auth(self, stale_access_token: str | None = None):
+        """
+        stale_access_token - токен, с которым получили отказ.
+        Если его уже обновил другой процесс, повторного логина не будет.
+        """
+        self.get_token_manager().refresh(stale_access_token or self.access_token)
 
     def save(self, *args, **kwargs):
 
@@ -43,6 +57,29 @@ class BazonAccount(models.Model):
         verbose_name_plural = "Аккаунты Bazon"
 
 
+class SaleDocumentSyncState(models.Model):
+    """
+    Курсор инкрементального опроса сделок аккаунта.
+    last_seen_id - самый новый виденный документ, head_digests - отпечатки
+    документов горячего окна (id -> digest), sweep_offset - где продолжить обход старых.
+    """
+
+    bazon_account = models.OneToOneField(
+        BazonAccount, on_delete=models.CASCADE, related_name="sale_documents_sync"
+    )
+    last_seen_id = models.PositiveIntegerField(default=0)
+    head_digests = models.JSONField(default=dict, blank=True)
+    sweep_offset = models.PositiveIntegerField(default=0)
+    last_sweep_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Курсор опроса сделок"
+        verbose_name_plural = "Курсоры опроса сделок"
+
+    def __str__(self):
+        return f"{self.bazon_account} (id {self.last_seen_id})"
+
+
 class SaleDocument(models.Model):
 
     bazon_account = models.ForeignKey(BazonAccount, on_delete=models.CASCADE)
@@ -59,6 +96,8 @@ class SaleDocument(models.Model):
     manager_id = models.PositiveIntegerField(null=True, blank=True)
     manager_name = models.CharField(max_length=255, null=True, blank=True)
     amo_lead_id = models.PositiveIntegerField(blank=True, null=True)
+    # Отпечаток полей SALE_DOCUMENT_FINGERPRINT_FIELDS - по нему опрос видит изменения
+    fingerprint = models.CharField(max_length=16, blank=True, default="")
 
     class Meta:
         constraints = [
@@ -71,27 +110,17 @@ class SaleDocument(models.Model):
     def get_api(self):
         return self.bazon_account.get_api()
 
-    class _GenerateLockKey:
+    def generate_lock_key(self) -> DocumentLease:
+        return DocumentLease(self)
 
-        def __init__(self, sale_document: "SaleDocument"):
-            self.sale_document = sale_document
-            self.lock_key = None
+    def get_fingerprint(self) -> str:
+        return fingerprint(vars(self), settings.SALE_DOCUMENT_FINGERPRINT_FIELDS)
 
-        def __enter__(self):
-            api = self.sale_document.get_api()
-            lock_key = api.generate_lock_key(self.sale_document.number)
-            if lock_key is None:
-                raise APIException(detail="cant_generate_lock_key", code=403)
-            self.lock_key = lock_key
-            return self.lock_key
-
-        def __exit__(self, exc_type, exc_val, exc_tb):
-            if self.lock_key is not None:
-                api = self.sale_document.get_api()
-                api.drop_lock_key(self.sale_document.internal_id, self.lock_key)
-
-    def generate_lock_key(self):
-        return self._GenerateLockKey(self)
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.get_fingerprint()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "fingerprint"}
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "Сделка в Bazon"
@@ -114,6 +143,8 @@ class Contractor(models.Model):
     balance_reserve = models.PositiveIntegerField()
     balance = models.PositiveIntegerField()
     amo_id = models.PositiveIntegerField(null=True, blank=True)
+    # Отпечаток полей CONTRACTOR_FINGERPRINT_FIELDS - по нему опрос видит изменения
+    fingerprint = models.CharField(max_length=16, blank=True, default="")
 
     class Meta:
         constraints = [
@@ -125,6 +156,156 @@ class Contractor(models.Model):
     def __str__(self):
         return self.name
 
+    def get_fingerprint(self) -> str:
+        return fingerprint(vars(self), settings.CONTRACTOR_FINGERPRINT_FIELDS)
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.get_fingerprint()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "fingerprint"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Контрагент в Bazon"
         verbose_name_plural = "Контрагенты в Bazon"
+
+
+class CatalogStorage(models.Model):
+    """
+    Склад, товары которого зеркалируются локально для поиска из виджета.
+    synced_at - конец последнего полного обхода (None - зеркало еще не готово),
+    max_seen_id - самый новый виденный товар, sweep_offset - где продолжить обход.
+    """
+
+    bazon_account = models.ForeignKey(
+        BazonAccount, on_delete=models.CASCADE, related_name="catalog_storages"
+    )
+    storage_id = models.PositiveIntegerField()
+    max_seen_id = models.PositiveIntegerField(default=0)
+    sweep_offset = models.PositiveIntegerField(default=0)
+    sweep_started_at = models.DateTimeField(null=True, blank=True)
+    previous_sweep_started_at = models.DateTimeField(null=True, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Склад каталога"
+        verbose_name_plural = "Склады каталога"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bazon_account", "storage_id"],
+                name="unique_catalog_storage_per_bazon_account",
+            )
+        ]
+
+    def search(self, query: str = None, offset: int = 0, limit: int = 100) -> list:
+        """Товары склада в формате getProducts, новые первыми."""
+        items = self.items.all()
+        if query:
+            items = items.filter(
+                models.Q(part_number__istartswith=query) | models.Q(name__icontains=query)
+            )
+        return list(
+            items.order_by("-internal_id").values_list("payload", flat=True)[
+                offset : offset + limit
+            ]
+        )
+
+    def __str__(self):
+        return f"{self.bazon_account}: склад {self.storage_id}"
+
+
+class CatalogItem(models.Model):
+    storage = models.ForeignKey(
+        CatalogStorage, on_delete=models.CASCADE, related_name="items"
+    )
+    internal_id = models.PositiveIntegerField()
+    name = models.CharField(max_length=512, blank=True, default="")
+    part_number = models.CharField(max_length=255, blank=True, default="")
+    digest = models.CharField(max_length=16)
+    payload = models.JSONField()
+    synced_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Товар каталога"
+        verbose_name_plural = "Товары каталога"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["storage", "internal_id"],
+                name="unique_catalog_item_per_storage",
+            )
+        ]
+        indexes = [
+            # Триграммы для ILIKE из CatalogStorage.search (нужен pg_trgm).
+            # istartswith/icontains Django строит как UPPER("col"::text) LIKE UPPER(%s),
+            # поэтому индексируется то же выражение, иначе планировщик его не берет
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="catalog_item_name_trgm",
+            ),
+            GinIndex(
+                OpClass(Upper("part_number"), name="gin_trgm_ops"),
+                name="catalog_item_part_number_trgm",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class AmoOutbox(models.Model):
+    """
+    Запись в amo, которую нужно выполнить. Создается в одной транзакции
+    с изменением в БД, отправляет ее amo_outbox_dispatcher.
+    Пока запись ждет отправки, новые с тем же dedupe_key сливаются в нее.
+    """
+
+    CREATE_LEAD = "create_lead"
+    UPDATE_LEAD = "update_lead"
+    UPSERT_CONTACT = "upsert_contact"
+    LINK_CONTACT = "link_contact"
+    KINDS = [
+        (CREATE_LEAD, "Создание сделки"),
+        (UPDATE_LEAD, "Обновление сделки"),
+        (UPSERT_CONTACT, "Создание/обновление контакта"),
+        (LINK_CONTACT, "Привязка контакта к сделке"),
+    ]
+
+    PENDING = "pending"
+    DONE = "done"
+    DEAD = "dead"
+    STATUSES = [
+        (PENDING, "Ожидает"),
+        (DONE, "Отправлено"),
+        (DEAD, "Не отправлено"),
+    ]
+
+    amo_account = models.ForeignKey(
+        "amo.AmoAccount", on_delete=models.CASCADE, related_name="outbox"
+    )
+    kind = models.CharField(max_length=20, choices=KINDS)
+    dedupe_key = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    # Растет при каждом слиянии: отправленная версия устарела - запись уйдет еще раз
+    version = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Запись в AmoCRM"
+        verbose_name_plural = "Очередь записей в AmoCRM"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["amo_account", "dedupe_key"],
+                condition=models.Q(status="pending"),
+                name="unique_pending_outbox_key",
+            )
+        ]
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.dedupe_key}"
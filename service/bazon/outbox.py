@@ -0,0 +1,428 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from loguru import logger
+from amo.models import AmoAccount
+from .models import AmoOutbox, Contractor, SaleDocument
+
+
+class OutboxNotReady(Exception):
+    """Запись ждет другую: сделка или контакт в amo еще не созданы."""
+
+
+def merge_pending_many(
+    amo_account: AmoAccount,
+    payloads: dict,
+    delay: float = 0,
+    max_delay: float = 0,
+) -> set:
+    """
+    Сливает payloads {dedupe_key: payload} в ожидающие записи с теми же ключами:
+    одна выборка и один bulk_update на пачку. Возвращает ключи, которые слились.
+    Payload - полное состояние (сделка, контакт целиком), поэтому его ключи
+    заменяют старые, а не сливаются по полям.
+    delay - отправка откладывается еще на delay секунд после последнего слияния,
+    но не дальше max_delay от создания записи.
+    """
+    entries = list(
+        AmoOutbox.objects.select_for_update().filter(
+            amo_account=amo_account,
+            dedupe_key__in=list(payloads),
+            status=AmoOutbox.PENDING,
+        )
+    )
+    now = timezone.now()
+    for entry in entries:
+        entry.payload = {**entry.payload, **payloads[entry.dedupe_key]}
+        entry.version += 1
+        if delay:
+            entry.available_at = max(
+                entry.available_at,
+                min(
+                    now + timedelta(seconds=delay),
+                    entry.created_at + timedelta(seconds=max_delay),
+                ),
+            )
+        # bulk_update не проставляет auto_now
+        entry.updated_at = now
+    AmoOutbox.objects.bulk_update(
+        entries, ["payload", "version", "available_at", "updated_at"]
+    )
+    return {entry.dedupe_key for entry in entries}
+
+
+def merge_pending(
+    amo_account: AmoAccount,
+    dedupe_key: str,
+    payload: dict,
+    delay: float = 0,
+    max_delay: float = 0,
+) -> bool:
+    """Сливает payload в ожидающую запись с тем же ключом, если она есть."""
+    return bool(
+        merge_pending_many(amo_account, {dedupe_key: payload}, delay, max_delay)
+    )
+
+
+def enqueue(
+    amo_account: AmoAccount,
+    kind: str,
+    dedupe_key: str,
+    payload: dict,
+    delay: float = 0,
+    max_delay: float = 0,
+):
+    """
+    Ставит запись в amo в очередь. Вызывается внутри транзакции изменения:
+    откатится изменение - откатится и запись. С delay запись копит изменения
+    (см. merge_pending_many) и уходит одним запросом с последним состоянием.
+    """
+    with transaction.atomic():
+        if merge_pending(amo_account, dedupe_key, payload, delay, max_delay):
+            return
+        try:
+            with transaction.atomic():
+                AmoOutbox.objects.create(
+                    amo_account=amo_account,
+                    kind=kind,
+                    dedupe_key=dedupe_key,
+                    payload=payload,
+                    available_at=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            # Запись с тем же ключом создали параллельно - сливаемся в нее
+            merge_pending(amo_account, dedupe_key, payload, delay, max_delay)
+
+
+def enqueue_many(
+    amo_account: AmoAccount,
+    kind: str,
+    payloads: dict,
+    delay: float = 0,
+    max_delay: float = 0,
+):
+    """
+    enqueue для пачки записей одного вида {dedupe_key: payload}: слияние
+    и создание - по запросу на пачку, а не на запись.
+    """
+    if not payloads:
+        return
+    with transaction.atomic():
+        merged = merge_pending_many(amo_account, payloads, delay, max_delay)
+        available_at = timezone.now() + timedelta(seconds=delay)
+        entries = [
+            AmoOutbox(
+                amo_account=amo_account,
+                kind=kind,
+                dedupe_key=dedupe_key,
+                payload=payload,
+                available_at=available_at,
+            )
+            for dedupe_key, payload in payloads.items()
+            if dedupe_key not in merged
+        ]
+        try:
+            with transaction.atomic():
+                AmoOutbox.objects.bulk_create(entries)
+        except IntegrityError:
+            # Часть записей создали параллельно - ставим по одной со слиянием
+            for entry in entries:
+                enqueue(
+                    amo_account, kind, entry.dedupe_key, entry.payload, delay, max_delay
+                )
+
+
+def _lead_marker(lead: dict, bazon_field: int | None) -> str | None:
+    if not bazon_field:
+        return lead.get("name")
+    for field in lead.get("custom_fields_values") or []:
+        if field.get("field_id") == int(bazon_field) and field.get("values"):
+            return str(field["values"][0].get("value"))
+    return None
+
+
+def _find_created_leads(
+    amo_account: AmoAccount, client, entries: list[AmoOutbox], documents: dict
+) -> dict:
+    """
+    Ищет в amo сделки, которые прошлая попытка могла создать, не сохранив id:
+    таймаут или 5xx после того, как amo создал сделки, сбой записи id в БД,
+    падение диспетчера. Метка сделки - internal_id документа в поле bazon_field
+    (см. BazonSaleToAmoLeadSerializer), без этого поля - имя сделки.
+    Возвращает {pk записи: id сделки}.
+    """
+    bazon_field = amo_account.get_config().get("bazon_field")
+    found = {}
+    for entry in entries:
+        sale_document = documents[entry.payload["sale_document_id"]]
+        marker = (
+            str(sale_document.internal_id)
+            if bazon_field
+            else entry.payload["lead"].get("name")
+        )
+        for lead in client.find_deals(marker):
+            if _lead_marker(lead, bazon_field) == marker:
+                found[entry.pk] = lead["id"]
+                break
+    return found
+
+
+def _send_leads(amo_account: AmoAccount, entries: list[AmoOutbox]) -> dict:
+    """
+    Создание и обновление сделок пачками (DealClient.create_deals/update_deals).
+    Создание сделки, у которой уже есть id (повтор после сбоя), уходит
+    как обновление; из записей одной сделки в PATCH идет самая свежая.
+    Создание, которое уже пытались отправить, сначала ищется в amo
+    (_find_created_leads) и создается заново, только если сделки там нет.
+    """
+    documents = SaleDocument.objects.in_bulk(
+        [entry.payload["sale_document_id"] for entry in entries]
+    )
+    results, to_create, to_update = {}, {}, {}
+    for entry in entries:
+        sale_document = documents.get(entry.payload["sale_document_id"])
+        if sale_document is None:
+            results[entry.pk] = None
+        elif sale_document.amo_lead_id:
+            to_update.setdefault(sale_document.amo_lead_id, []).append(entry)
+        elif entry.kind == AmoOutbox.CREATE_LEAD:
+            to_create[entry.pk] = entry
+        else:
+            results[entry.pk] = OutboxNotReady("lead_not_created")
+
+    client = amo_account.get_deal_client()
+    # locked_until у забранной записи - значение до claim: если оно есть,
+    # прошлый диспетчер не довел запись до конца
+    retried = [
+        entry for entry in to_create.values() if entry.attempts or entry.locked_until
+    ]
+    if retried:
+        found = _find_created_leads(amo_account, client, retried, documents)
+        sale_documents = []
+        for pk, lead_id in found.items():
+            entry = to_create.pop(pk)
+            sale_document = documents[entry.payload["sale_document_id"]]
+            sale_document.amo_lead_id = lead_id
+            sale_documents.append(sale_document)
+            # Найденная сделка могла уйти со старым состоянием - обновляем
+            to_update.setdefault(lead_id, []).append(entry)
+        SaleDocument.objects.bulk_update(sale_documents, ["amo_lead_id"])
+    if to_create:
+        created, errors = client.create_deals(
+            {pk: entry.payload["lead"] for pk, entry in to_create.items()}
+        )
+        sale_documents = []
+        for pk, entry in to_create.items():
+            if pk in created:
+                sale_document = documents[entry.payload["sale_document_id"]]
+                sale_document.amo_lead_id = created[pk]
+                sale_documents.append(sale_document)
+            results[pk] = errors.get(pk)
+        # id сохраняются сразу, до остальных запросов к amo
+        SaleDocument.objects.bulk_update(sale_documents, ["amo_lead_id"])
+    if to_update:
+        _, errors = client.update_deals(
+            {
+                lead_id: max(group, key=lambda entry: entry.updated_at).payload["lead"]
+                for lead_id, group in to_update.items()
+            }
+        )
+        for lead_id, group in to_update.items():
+            for entry in group:
+                results[entry.pk] = errors.get(lead_id)
+    return results
+
+
+def _upsert_contacts(amo_account: AmoAccount, entries: list[AmoOutbox]) -> dict:
+    """Создание и обновление контактов пачками (ContactClient.create/update_contacts)."""
+    contractors = Contractor.objects.in_bulk(
+        [entry.payload["contractor_id"] for entry in entries]
+    )
+    results, to_create, to_update = {}, {}, {}
+    for entry in entries:
+        contractor = contractors.get(entry.payload["contractor_id"])
+        if contractor is None:
+            results[entry.pk] = None
+        elif contractor.amo_id:
+            to_update[contractor.amo_id] = entry
+        else:
+            to_create[entry.pk] = entry
+
+    client = amo_account.get_contact_client()
+    if to_create:
+        created, errors = client.create_contacts(
+            {pk: entry.payload["contact"] for pk, entry in to_create.items()}
+        )
+        updated_contractors = []
+        for pk, entry in to_create.items():
+            if pk in created:
+                contractor = contractors[entry.payload["contractor_id"]]
+                contractor.amo_id = created[pk]
+                updated_contractors.append(contractor)
+            results[pk] = errors.get(pk)
+        Contractor.objects.bulk_update(updated_contractors, ["amo_id"])
+    if to_update:
+        _, errors = client.update_contacts(
+            {amo_id: entry.payload["contact"] for amo_id, entry in to_update.items()}
+        )
+        for amo_id, entry in to_update.items():
+            results[entry.pk] = errors.get(amo_id)
+    return results
+
+
+def _link_contacts(amo_account: AmoAccount, entries: list[AmoOutbox]) -> dict:
+    """Привязка контактов к сделкам пачками через POST /leads/link."""
+    documents = SaleDocument.objects.in_bulk(
+        [entry.payload["sale_document_id"] for entry in entries]
+    )
+    contractors = Contractor.objects.in_bulk(
+        [entry.payload["contractor_id"] for entry in entries]
+    )
+    results, links = {}, {}
+    for entry in entries:
+        sale_document = documents.get(entry.payload["sale_document_id"])
+        contractor = contractors.get(entry.payload["contractor_id"])
+        if sale_document is None or contractor is None:
+            results[entry.pk] = None
+        elif not sale_document.amo_lead_id or not contractor.amo_id:
+            results[entry.pk] = OutboxNotReady("lead_or_contact_not_created")
+        else:
+            links[entry.pk] = {
+                "e_id": sale_document.amo_lead_id,
+                "to_type": "contacts",
+                "to_id": contractor.amo_id,
+            }
+
+    if links:
+        linked, errors = amo_account.get_amo_client().link_entities("leads", links)
+        results.update({pk: errors.get(pk) for pk in links})
+        SaleDocument.objects.filter(
+            pk__in=[
+                entry.payload["sale_document_id"]
+                for entry in entries
+                if entry.pk in linked
+            ]
+        ).update(contractor_linked=True)
+    return results
+
+
+class OutboxDispatcher:
+    """
+    Отправляет очередь AmoOutbox в amo. Записи забираются пачкой: строка
+    блокируется на время выборки (skip locked) и получает locked_until,
+    поэтому диспетчеров может быть несколько, а транзакция не ждет ответа amo.
+    Пачка делится по аккаунту и обработчику, обработчики идут в порядке HANDLERS:
+    сделки, контакты, привязки - каждые пачками по 250 в одном запросе.
+    Ошибка - повтор с экспоненциальной паузой, после AMO_OUTBOX_MAX_ATTEMPTS
+    запись помечается DEAD. Если запись слили с новой версией, пока она
+    отправлялась, она остается в очереди и уйдет еще раз.
+
+    Запрос в amo и отметка записи не атомарны: упав между ними, диспетчер
+    отправит запись повторно. Обновления и привязки от этого не страдают,
+    создание сделки перед повтором ищется в amo (_find_created_leads).
+    Создание контакта так не проверяется и после такого сбоя может задвоиться.
+    """
+
+    HANDLERS = [
+        ((AmoOutbox.CREATE_LEAD, AmoOutbox.UPDATE_LEAD), _send_leads),
+        ((AmoOutbox.UPSERT_CONTACT,), _upsert_contacts),
+        ((AmoOutbox.LINK_CONTACT,), _link_contacts),
+    ]
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or settings.AMO_OUTBOX_BATCH_SIZE
+        self._cleaned_at = 0
+
+    def claim(self) -> list[AmoOutbox]:
+        now = timezone.now()
+        with transaction.atomic():
+            entries = list(
+                AmoOutbox.objects.select_for_update(skip_locked=True, of=("self",))
+                .select_related("amo_account")
+                .filter(status=AmoOutbox.PENDING, available_at__lte=now)
+                .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+                .order_by("id")[: self.batch_size]
+            )
+            AmoOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+                locked_until=now + timedelta(seconds=settings.AMO_OUTBOX_LOCK_TIMEOUT)
+            )
+        return entries
+
+    def _complete(self, entry: AmoOutbox):
+        done = AmoOutbox.objects.filter(pk=entry.pk, version=entry.version).update(
+            status=AmoOutbox.DONE,
+            locked_until=None,
+            last_error="",
+            updated_at=timezone.now(),
+        )
+        if not done:
+            AmoOutbox.objects.filter(pk=entry.pk).update(locked_until=None)
+
+    def _retry(self, entry: AmoOutbox, error: Exception):
+        attempts = entry.attempts + 1
+        delay = min(
+            settings.AMO_OUTBOX_MAX_RETRY_DELAY,
+            settings.AMO_OUTBOX_RETRY_DELAY * 2 ** entry.attempts,
+        )
+        dead = attempts >= settings.AMO_OUTBOX_MAX_ATTEMPTS
+        if dead:
+            logger.error(f"Outbox {entry}: не отправлено за {attempts} попыток ({error})")
+        elif not isinstance(error, OutboxNotReady):
+            logger.warning(f"Outbox {entry}: {error}, повтор через {delay} с")
+        AmoOutbox.objects.filter(pk=entry.pk).update(
+            status=AmoOutbox.DEAD if dead else AmoOutbox.PENDING,
+            attempts=F("attempts") + 1,
+            available_at=timezone.now() + timedelta(seconds=delay),
+            locked_until=None,
+            last_error=str(error)[:1000],
+            updated_at=timezone.now(),
+        )
+
+    def dispatch(self, entries: list[AmoOutbox]):
+        for kinds, handler in self.HANDLERS:
+            groups = {}
+            for entry in entries:
+                if entry.kind in kinds:
+                    groups.setdefault(entry.amo_account_id, []).append(entry)
+            for group in groups.values():
+                try:
+                    results = handler(group[0].amo_account, group)
+                except Exception as error:
+                    results = {entry.pk: error for entry in group}
+                for entry in group:
+                    error = results.get(entry.pk)
+                    if error is None:
+                        self._complete(entry)
+                    else:
+                        self._retry(entry, error)
+
+    def cleanup(self):
+        """Удаляет отправленные записи старше AMO_OUTBOX_RETENTION_DAYS."""
+        AmoOutbox.objects.filter(
+            status=AmoOutbox.DONE,
+            updated_at__lt=timezone.now()
+            - timedelta(days=settings.AMO_OUTBOX_RETENTION_DAYS),
+        ).delete()
+
+    def run_once(self) -> int:
+        entries = self.claim()
+        if entries:
+            self.dispatch(entries)
+        return len(entries)
+
+    def run_forever(self):
+        while True:
+            close_old_connections()
+            try:
+                if time.monotonic() - self._cleaned_at > 3600:
+                    self.cleanup()
+                    self._cleaned_at = time.monotonic()
+                dispatched = self.run_once()
+            except Exception as error:
+                logger.error(f"Error in amo outbox dispatching: {error}")
+                dispatched = 0
+            if dispatched < self.batch_size:
+                time.sleep(settings.AMO_OUTBOX_POLL_INTERVAL)
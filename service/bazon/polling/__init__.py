@@ -0,0 +1,10 @@
+from .sale_documents import (
+    SaleDocumentRecord,
+    SaleDocumentSync,
+    normalize_sale_documents,
+    poll_sale_documents,
+    sync_sale_documents,
+)
+from .catalog import CatalogSync
+from .scheduler import PollingScheduler
+from .leases import AccountLeases
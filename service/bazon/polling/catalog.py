@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.utils import timezone
+from loguru import logger
+from bazon.models import CatalogItem, CatalogStorage
+from utils.fingerprint import fingerprint
+
+
+def _part_number(entity: dict) -> str | None:
+    """Артикул из первого непустого ключа CATALOG_PART_NUMBER_KEYS или None."""
+    for key in settings.CATALOG_PART_NUMBER_KEYS:
+        if entity.get(key):
+            return str(entity[key])[:255]
+    return None
+
+
+class CatalogSync:
+    """
+    Обновление локального зеркала товаров одного склада.
+
+    Товары getProducts отсортированы по id desc. За проход:
+      - голова читается до max_seen_id - новые товары;
+      - обход по кругу продолжается с sweep_offset на CATALOG_SWEEP_PAGES страниц
+        (первый, пока зеркало не готово, - целиком) - изменения цен и остатков.
+        Товары, которых не было в двух последних полных кругах, удаляются.
+    В БД пишутся только новые и изменившиеся товары.
+    """
+
+    def __init__(self, storage: CatalogStorage, bazon_api=None):
+        self.storage = storage
+        self.bazon_api = bazon_api or storage.bazon_account.get_api()
+        self.page_size = settings.CATALOG_PAGE_SIZE
+
+    def _items(self, start: int = 0, read_ahead: bool = False):
+        return self.bazon_api.iter_items(
+            page_size=self.page_size,
+            start=start,
+            read_ahead=read_ahead,
+            storages_ids=[self.storage.storage_id],
+        )
+
+    def _upsert(self, entities: list[dict]):
+        now = timezone.now()
+        entities = {int(entity["id"]): entity for entity in entities if "id" in entity}
+        known = dict(
+            self.storage.items.filter(internal_id__in=entities).values_list(
+                "internal_id", "digest"
+            )
+        )
+        changed, unchanged, without_part_number = [], [], []
+        for internal_id, entity in entities.items():
+            digest = fingerprint(entity)
+            if known.get(internal_id) == digest:
+                unchanged.append(internal_id)
+                continue
+            part_number = _part_number(entity)
+            if part_number is None:
+                without_part_number.append(entity)
+            item = CatalogItem(
+                storage=self.storage,
+                internal_id=internal_id,
+                name=str(entity.get("name") or "")[:512],
+                part_number=part_number or "",
+                digest=digest,
+                payload=entity,
+                synced_at=now,
+            )
+            changed.append(item)
+
+        if without_part_number:
+            # Поиск по артикулу таких товаров не найдет - видно, если ключи не те
+            logger.warning(
+                f"{self.storage}: у {len(without_part_number)} товаров нет артикула "
+                f"в {settings.CATALOG_PART_NUMBER_KEYS}, ключи товара: "
+                f"{sorted(without_part_number[0])}"
+            )
+        CatalogItem.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["storage", "internal_id"],
+            update_fields=["name", "part_number", "digest", "payload", "synced_at"],
+        )
+        if unchanged:
+            self.storage.items.filter(internal_id__in=unchanged).update(synced_at=now)
+        if entities:
+            self.storage.max_seen_id = max(self.storage.max_seen_id, *entities)
+
+    def _read_head(self):
+        if self.storage.synced_at is None:
+            return
+        for page in self._items().pages():
+            self._upsert(page)
+            if min(int(entity.get("id", 0)) for entity in page) <= self.storage.max_seen_id:
+                break
+
+    def _sweep(self):
+        if self.storage.sweep_offset == 0:
+            self.storage.sweep_started_at = timezone.now()
+        budget = None if self.storage.synced_at is None else settings.CATALOG_SWEEP_PAGES
+        paginator = self._items(start=self.storage.sweep_offset, read_ahead=True)
+        pages = paginator.pages()
+        finished = True
+        for number, page in enumerate(pages, start=1):
+            self._upsert(page)
+            self.storage.sweep_offset = paginator.cursor + len(page)
+            if len(page) < self.page_size:
+                break
+            if budget is not None and number >= budget:
+                finished = False
+                break
+        pages.close()
+
+        if finished:
+            # Пока идет обход, проданные товары сдвигают остальные к началу списка,
+            # и часть товаров круг может пропустить. Удаляем только то,
+            # что не встретилось два круга подряд
+            cutoff = self.storage.previous_sweep_started_at
+            if cutoff is not None:
+                removed, _ = self.storage.items.filter(synced_at__lt=cutoff).delete()
+                if removed:
+                    logger.info(f"{self.storage}: удалено из каталога {removed} товаров")
+            self.storage.previous_sweep_started_at = self.storage.sweep_started_at
+            self.storage.sweep_offset = 0
+            self.storage.synced_at = timezone.now()
+
+    def run_once(self):
+        self._read_head()
+        self._sweep()
+        self.storage.save()
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from django.conf import settings
+from django_redis import get_redis_connection
+from loguru import logger
+
+
+# Продлить/отпустить аренду, только если она все еще наша
+_EXTEND_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class AccountLeases:
+    """
+    Делит аккаунты между несколькими процессами опроса через Redis.
+
+        leases = AccountLeases("sale_documents")
+        leases.start()
+        PollingScheduler(
+            leases.guard(poll_sale_documents),
+            leases.loader(BazonAccount.objects.all),
+            accounts_refresh=leases.refresh_interval,
+        ).run_forever()
+
+    Живые процессы отмечаются в sorted set (heartbeat раз в ttl/3), аккаунт
+    достается процессу по rendezvous-хешу от списка живых. Опрашивать аккаунт
+    можно только под арендой - ключом в Redis с ttl, который продлевает heartbeat.
+    Упавший процесс пропадает из списка через ttl, его аккаунты переходят к другим,
+    как только истекут его аренды. Аккаунт, который сейчас опрашивается,
+    не отпускается до конца прохода.
+    """
+
+    def __init__(self, name: str, ttl: int = None):
+        self.name = name
+        self.ttl = ttl or settings.SALE_POLLING_LEASE_TTL
+        self.refresh_interval = max(self.ttl / 3, 1)
+        self.member = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.members_key = f"bazon:polling:{name}:members"
+        self.owned: set[int] = set()
+        self.busy: set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _lease_key(self, pk: int) -> str:
+        return f"bazon:polling:{self.name}:lease:{pk}"
+
+    def _members(self, redis) -> list[str]:
+        redis.zremrangebyscore(self.members_key, "-inf", time.time() - self.ttl)
+        return [member.decode() for member in redis.zrange(self.members_key, 0, -1)]
+
+    def _owner(self, pk: int, members: list[str]) -> str:
+        return max(
+            members,
+            key=lambda member: hashlib.blake2b(
+                f"{member}:{pk}".encode(), digest_size=8
+            ).digest(),
+        )
+
+    def heartbeat(self):
+        """Отмечает процесс живым и продлевает его аренды; потерянные забывает."""
+        redis = get_redis_connection("default")
+        redis.zadd(self.members_key, {self.member: time.time()})
+        with self._lock:
+            owned = list(self.owned)
+        lost = [
+            pk
+            for pk in owned
+            if not redis.eval(
+                _EXTEND_SCRIPT, 1, self._lease_key(pk), self.member, self.ttl * 1000
+            )
+        ]
+        if lost:
+            logger.warning(f"Polling {self.name}: потеряны аренды {lost}")
+            with self._lock:
+                self.owned.difference_update(lost)
+
+    def release(self, pk: int):
+        with self._lock:
+            self.owned.discard(pk)
+        get_redis_connection("default").eval(
+            _RELEASE_SCRIPT, 1, self._lease_key(pk), self.member
+        )
+
+    def claim(self, accounts) -> list:
+        """Из всех аккаунтов оставляет те, что этот процесс держит в аренде."""
+        self.heartbeat()
+        redis = get_redis_connection("default")
+        members = self._members(redis)
+        claimed = []
+        for account in accounts:
+            with self._lock:
+                owned, busy = account.pk in self.owned, account.pk in self.busy
+            if self._owner(account.pk, members) != self.member:
+                # Аккаунт перешел к другому процессу - отпускаем после прохода
+                if owned and not busy:
+                    self.release(account.pk)
+                elif owned:
+                    claimed.append(account)
+                continue
+            if not owned and redis.set(
+                self._lease_key(account.pk), self.member, nx=True, ex=self.ttl
+            ):
+                with self._lock:
+                    self.owned.add(account.pk)
+                owned = True
+            if owned:
+                claimed.append(account)
+
+        pks = {account.pk for account in accounts}
+        with self._lock:
+            gone = self.owned - pks - self.busy
+        for pk in gone:
+            self.release(pk)
+        return claimed
+
+    def loader(self, load_accounts):
+        """load_accounts для PollingScheduler: только аккаунты в аренде."""
+        return lambda: self.claim(list(load_accounts()))
+
+    def guard(self, poll):
+        """poll для PollingScheduler: без аренды аккаунт пропускается."""
+
+        def guarded(account):
+            with self._lock:
+                if account.pk not in self.owned:
+                    return 0
+                self.busy.add(account.pk)
+            try:
+                return poll(account)
+            finally:
+                with self._lock:
+                    self.busy.discard(account.pk)
+
+        return guarded
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.heartbeat()
+            except Exception as error:
+                logger.error(f"Polling {self.name}: heartbeat не прошел ({error})")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает heartbeat и отпускает аренды - их сразу подхватят другие."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            owned = list(self.owned)
+        for pk in owned:
+            self.release(pk)
+        get_redis_connection("default").zrem(self.members_key, self.member)
@@ -0,0 +1,291 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import MappingProxyType
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.utils import timezone
+from loguru import logger
+from rest_framework.exceptions import APIException
+from utils.fingerprint import fingerprint
+from utils.resilience import UpstreamUnavailable
+from bazon.locks import release_idle_leases
+from bazon.models import BazonAccount, SaleDocument, SaleDocumentSyncState
+from bazon.events import (
+    enqueue_lead_updates,
+    on_create_sale_document,
+    sync_sale_contractors,
+)
+
+
+# Поля сделки, которые приходят из Bazon (остальные ведет сервис)
+SALE_DOCUMENT_FIELDS = [
+    field
+    for field in SaleDocument._meta.concrete_fields
+    if field.name
+    not in (
+        "id",
+        "internal_id",
+        "bazon_account",
+        "amo_account",
+        "amo_lead_id",
+        "contractor_linked",
+    )
+]
+
+
+def normalize_sale_document(raw_document: dict) -> dict | None:
+    """Документ external-api -> поля SaleDocument (id -> internal_id)."""
+    if "id" not in raw_document:
+        return None
+    data = {"internal_id": int(raw_document["id"])}
+    for field in SALE_DOCUMENT_FIELDS:
+        if field.name in raw_document:
+            data[field.name] = field.to_python(raw_document[field.name])
+    return data
+
+
+@dataclass(frozen=True)
+class SaleDocumentRecord:
+    """Документ Bazon, разобранный один раз на проход; дальше только читается."""
+
+    internal_id: int
+    data: MappingProxyType
+    fingerprint: str
+
+
+def normalize_sale_documents(raw_documents: list[dict]) -> tuple[SaleDocumentRecord]:
+    """Разбирает страницу документов в записи для всех связанных amo-аккаунтов."""
+    fields = settings.SALE_DOCUMENT_FINGERPRINT_FIELDS
+    records = []
+    for raw_document in raw_documents:
+        try:
+            document = normalize_sale_document(raw_document)
+        except (ValueError, ValidationError) as error:
+            logger.error(f"Документ не разобран: {error} {raw_document}")
+            continue
+        if document is None:
+            logger.warning(f"Документ без id: {raw_document}")
+            continue
+        records.append(
+            SaleDocumentRecord(
+                internal_id=document["internal_id"],
+                data=MappingProxyType(document),
+                fingerprint=fingerprint(document, fields),
+            )
+        )
+    return tuple(records)
+
+
+def sync_sale_documents(
+    records: tuple[SaleDocumentRecord], bazon_account, amo_account
+) -> set:
+    """
+    Сверяет записи документов Bazon со сделками amo-аккаунта.
+    Существующие сделки читаются одним запросом по (amo_account, internal_id) -
+    только id и отпечаток; документ с тем же отпечатком пропускается,
+    изменившиеся пишутся одним bulk_update в одной транзакции с записями
+    в очередь amo (AmoOutbox), очередь пишется пачкой (enqueue_lead_updates).
+    Контрагенты изменившихся сделок запрашиваются по разу на контрагента:
+    опрос контрагентов выключен, их изменения приходят только так.
+    Новые документы создаются по одному: сделке нужен свой id до постановки
+    в очередь.
+    Возвращает internal_id документов с ошибкой.
+    """
+    existing = {
+        internal_id: (pk, amo_lead_id, stored)
+        for pk, internal_id, amo_lead_id, stored in SaleDocument.objects.filter(
+            amo_account=amo_account,
+            internal_id__in=[record.internal_id for record in records],
+        ).values_list("pk", "internal_id", "amo_lead_id", "fingerprint")
+    }
+
+    created, changed, updated = [], [], {}
+    for record in records:
+        if record.internal_id not in existing:
+            created.append(record.data)
+            continue
+        pk, amo_lead_id, stored = existing[record.internal_id]
+        if stored == record.fingerprint:
+            continue
+        sale_document = SaleDocument(
+            pk=pk,
+            bazon_account=bazon_account,
+            amo_account=amo_account,
+            amo_lead_id=amo_lead_id,
+            fingerprint=record.fingerprint,
+            **record.data,
+        )
+        changed.append((sale_document, dict(record.data)))
+        # bulk_update пишет одинаковый набор полей, документы группируются по нему
+        update_fields = tuple(sorted(record.data.keys() - {"internal_id"}))
+        updated.setdefault(update_fields, []).append(sale_document)
+
+    with transaction.atomic():
+        for update_fields, sale_documents in updated.items():
+            SaleDocument.objects.bulk_update(
+                sale_documents, [*update_fields, "fingerprint"]
+            )
+        if changed:
+            enqueue_lead_updates(changed, amo_account)
+
+    sale_documents = [sale_document for sale_document, _ in changed]
+    try:
+        failed = sync_sale_contractors(sale_documents, amo_account)
+    except Exception as error:
+        logger.error(f"Error in deal check: {error}")
+        failed = {sale_document.internal_id for sale_document in sale_documents}
+    if failed:
+        # Сбрасываем отпечаток, чтобы amo догнал изменения на следующем проходе
+        SaleDocument.objects.filter(
+            amo_account=amo_account, internal_id__in=failed
+        ).update(fingerprint="")
+    for document in created:
+        try:
+            on_create_sale_document(
+                {**document, "bazon_account": bazon_account}, amo_account
+            )
+        except Exception as error:
+            logger.error(f"Error in deal check: {error}")
+            failed.add(document["internal_id"])
+    return failed
+
+
+class SaleDocumentSync:
+    """
+    Инкрементальная синхронизация сделок одного аккаунта Bazon.
+
+    В external-api нет признака изменения документа, поэтому за проход:
+      - голова списка (order desc) читается до last_seen_id, но не меньше
+        SALE_DOCUMENTS_HEAD_WINDOW документов - там новые и свежие изменения;
+        документы головы, чей отпечаток не изменился, не сверяются с БД;
+      - раз в SALE_DOCUMENTS_SWEEP_INTERVAL читается одна страница скользящего
+        окна по старым документам, окно идет по кругу через всю историю.
+    Запросы и работа с БД растут с числом изменений, а не с размером окна.
+    """
+
+    def __init__(self, bazon_account: BazonAccount, bazon_api=None):
+        self.bazon_account = bazon_account
+        self.head_changes = 0
+        self.bazon_api = bazon_api or bazon_account.get_api()
+        self.state, _ = SaleDocumentSyncState.objects.get_or_create(
+            bazon_account=bazon_account
+        )
+
+    def _read_head(self) -> list[dict]:
+        head_window = settings.SALE_DOCUMENTS_HEAD_WINDOW
+        # Первый проход ограничен, остальное со временем покроет окно обхода
+        limit = None if self.state.last_seen_id else settings.SALE_DOCUMENTS_INITIAL_LIMIT
+        documents = []
+        for page in self.bazon_api.iter_sale_documents(page_size=head_window).pages():
+            documents.extend(page)
+            if limit is not None and len(documents) >= limit:
+                break
+            if min(document.get("id", 0) for document in page) <= self.state.last_seen_id:
+                break
+        return documents
+
+    def _read_sweep(self) -> list[dict]:
+        last_sweep_at = self.state.last_sweep_at
+        interval = settings.SALE_DOCUMENTS_SWEEP_INTERVAL
+        if last_sweep_at and (timezone.now() - last_sweep_at).total_seconds() < interval:
+            return []
+        page_size = settings.SALE_DOCUMENTS_SWEEP_PAGE_SIZE
+        paginator = self.bazon_api.iter_sale_documents(
+            page_size=page_size, start=self.state.sweep_offset
+        )
+        page = next(paginator.pages(), [])
+        # Дошли до конца истории - следующий обход снова с головы
+        if len(page) < page_size:
+            self.state.sweep_offset = 0
+        else:
+            self.state.sweep_offset += len(page)
+        self.state.last_sweep_at = timezone.now()
+        return page
+
+    def fetch_changes(self) -> list[dict]:
+        """
+        Документы, которые нужно сверить с БД; обновляет курсор в памяти.
+        head_changes - сколько из них новых или изменившихся в голове списка.
+        """
+        head = self._read_head()
+        head_digests = {}
+        changed = {}
+        for document in head:
+            if "id" not in document:
+                changed[id(document)] = document
+                continue
+            key = str(document["id"])
+            head_digests[key] = fingerprint(document)
+            if self.state.head_digests.get(key) != head_digests[key]:
+                changed[key] = document
+
+        self.head_changes = len(changed)
+        for document in self._read_sweep():
+            changed.setdefault(str(document.get("id", id(document))), document)
+
+        ids = [document["id"] for document in head if "id" in document]
+        if ids:
+            self.state.last_seen_id = max(self.state.last_seen_id, *ids)
+        self.state.head_digests = head_digests
+        return list(changed.values())
+
+    def _sync_amo_account(self, records, amo_account) -> set:
+        try:
+            return sync_sale_documents(records, self.bazon_account, amo_account)
+        except Exception as error:
+            logger.error(f"Error in amo account pulling: {error} {amo_account}")
+            return {record.internal_id for record in records}
+
+    def _sync_amo_account_in_thread(self, records, amo_account) -> set:
+        try:
+            return self._sync_amo_account(records, amo_account)
+        finally:
+            connections.close_all()
+
+    def run_once(self) -> int:
+        """
+        Один проход опроса. Возвращает число изменений в голове списка.
+        Страница разбирается один раз, amo-аккаунты сверяются параллельно.
+        """
+        records = normalize_sale_documents(self.fetch_changes())
+        amo_accounts = list(self.bazon_account.amo_accounts.all())
+        if len(amo_accounts) <= 1:
+            results = [
+                self._sync_amo_account(records, amo_account)
+                for amo_account in amo_accounts
+            ]
+        else:
+            workers = min(len(amo_accounts), settings.SALE_FANOUT_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        self._sync_amo_account_in_thread,
+                        records,
+                        amo_account,
+                    )
+                    for amo_account in amo_accounts
+                ]
+            results = [future.result() for future in futures]
+        # Не запоминаем отпечатки - документы сверятся на следующем проходе
+        for internal_id in set().union(*results):
+            self.state.head_digests.pop(str(internal_id), None)
+        self.state.save()
+        return self.head_changes
+
+
+def poll_sale_documents(bazon_account: BazonAccount) -> int:
+    """Проход опроса одного аккаунта для PollingScheduler."""
+    bazon_api = bazon_account.get_api()
+    try:
+        changes = SaleDocumentSync(bazon_account, bazon_api).run_once()
+    except UpstreamUnavailable:
+        raise
+    except APIException:
+        # Чаще всего это протухший токен - обновляем, аккаунт повторится после паузы
+        bazon_account.refresh_auth(bazon_api.get_access_token())
+        raise
+    release_idle_leases(bazon_account)
+    return changes
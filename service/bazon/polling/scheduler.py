@@ -0,0 +1,148 @@
+import contextvars
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import close_old_connections
+from loguru import logger
+
+
+class AccountState:
+    def __init__(self, account, interval: float):
+        self.account = account
+        self.interval = interval
+        self.next_run_at = time.monotonic()
+        self.failures = 0
+        self.running = False
+
+
+class PollingScheduler:
+    """
+    Планировщик опроса аккаунтов: у каждого свой интервал, который подстраивается
+    под частоту изменений - после прохода с изменениями вдвое короче,
+    после пустого в полтора раза длиннее (в пределах min/max_interval).
+    Ошибка аккаунта не трогает остальные: он уходит на экспоненциальную паузу.
+    К интервалу добавляется jitter, одновременно опрашивается не больше
+    concurrency аккаунтов.
+
+        PollingScheduler(poll_sale_documents, BazonAccount.objects.all).run_forever()
+
+    poll(account) возвращает число изменений за проход.
+    Несколько процессов делят аккаунты через AccountLeases.
+    """
+
+    def __init__(
+        self,
+        poll,
+        load_accounts,
+        concurrency: int = None,
+        min_interval: float = None,
+        max_interval: float = None,
+        jitter: float = None,
+        accounts_refresh: float = None,
+    ):
+        self.poll = poll
+        self.load_accounts = load_accounts
+        self.concurrency = concurrency or settings.SALE_POLLING_CONCURRENCY
+        self.min_interval = min_interval or settings.SALE_POLLING_MIN_INTERVAL
+        self.max_interval = max_interval or settings.SALE_POLLING_MAX_INTERVAL
+        self.jitter = jitter if jitter is not None else settings.SALE_POLLING_JITTER
+        self.accounts_refresh = (
+            accounts_refresh or settings.SALE_POLLING_ACCOUNTS_REFRESH
+        )
+        self.states: dict[int, AccountState] = {}
+        self._accounts_loaded_at = None
+
+    def _sync_accounts(self):
+        accounts = {account.pk: account for account in self.load_accounts()}
+        for pk in self.states.keys() - accounts.keys():
+            del self.states[pk]
+        for pk, account in accounts.items():
+            if pk in self.states:
+                self.states[pk].account = account
+            else:
+                self.states[pk] = AccountState(account, self.min_interval)
+        self._accounts_loaded_at = time.monotonic()
+
+    def _reschedule(self, state: AccountState, changes: int | None):
+        if changes is None:
+            state.failures += 1
+            delay = min(self.max_interval, self.min_interval * 2**state.failures)
+        else:
+            state.failures = 0
+            if changes:
+                state.interval = max(self.min_interval, state.interval / 2)
+            else:
+                state.interval = min(self.max_interval, state.interval * 1.5)
+            delay = state.interval
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        state.next_run_at = time.monotonic() + delay
+
+    def _run(self, state: AccountState) -> int | None:
+        close_old_connections()
+        try:
+            return self.poll(state.account)
+        except Exception as error:
+            logger.error(f"Error to pulling bazon account: {error} ({state.account})")
+            return None
+        finally:
+            close_old_connections()
+
+    def _submit_due(self, executor, running: dict):
+        now = time.monotonic()
+        due = sorted(
+            (
+                state
+                for state in self.states.values()
+                if not state.running and state.next_run_at <= now
+            ),
+            key=lambda state: state.next_run_at,
+        )
+        for state in due[: self.concurrency - len(running)]:
+            state.running = True
+            # Фоновый приоритет лимитера живет в contextvars - передаем его в поток
+            context = contextvars.copy_context()
+            running[executor.submit(context.run, self._run, state)] = state
+
+    def _timeout(self) -> float:
+        now = time.monotonic()
+        deadlines = [
+            state.next_run_at for state in self.states.values() if not state.running
+        ]
+        deadlines.append(self._accounts_loaded_at + self.accounts_refresh)
+        return max(min(deadlines) - now, 0.05)
+
+    def run_round(self) -> dict[int, int | None]:
+        """Один круг: каждый аккаунт опрашивается один раз, не больше concurrency сразу."""
+        self._sync_accounts()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                pk: executor.submit(contextvars.copy_context().run, self._run, state)
+                for pk, state in self.states.items()
+            }
+        return {pk: future.result() for pk, future in futures.items()}
+
+    def run_forever(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            running = {}
+            while True:
+                if (
+                    self._accounts_loaded_at is None
+                    or time.monotonic() - self._accounts_loaded_at >= self.accounts_refresh
+                ):
+                    try:
+                        self._sync_accounts()
+                    except Exception as error:
+                        logger.error(f"Error to load polling accounts: {error}")
+                        self._accounts_loaded_at = time.monotonic()
+                self._submit_due(executor, running)
+
+                timeout = self._timeout()
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    state = running.pop(future)
+                    state.running = False
+                    self._reschedule(state, future.result())
@@ -0,0 +1,89 @@
+from rest_framework.exceptions import APIException
+from utils.ttl_cache import TTLCache
+
+
+class BazonReferenceError(APIException):
+    """Bazon не отдал справочник, а в кеше его нет. response - ответ Bazon."""
+
+    status_code = 502
+    default_detail = "bazon_reference_error"
+    default_code = "bazon_reference_error"
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class BazonReference:
+    """
+    Справочники аккаунта Bazon (источники, склады, менеджеры, кассы, источники оплат)
+    через TTLCache: меняются они редко, поэтому виджет получает их из кеша,
+    а в Bazon уходит не больше одного запроса на обновление.
+    """
+
+    def __init__(self, bazon_account):
+        self.bazon_account = bazon_account
+        self.cache = TTLCache(f"bazon:reference:{bazon_account.pk}")
+
+    def _fetch(self, method: str, bazon_method: str, extract):
+        """
+        method - метод BazonApi, bazon_method - ключ ответа frontend-api.
+        Ошибку метода Bazon возвращает со статусом 200: такой ответ не кешируется.
+        """
+
+        def load():
+            response = getattr(self.bazon_account.get_api(), method)()
+            if response.status_code != 200 or response.error(bazon_method):
+                raise BazonReferenceError(response)
+            return extract(response)
+
+        return self.cache.get(method, load)
+
+    def sources(self) -> dict:
+        return self._fetch(
+            "get_sources",
+            "getSaleSourcesReference",
+            lambda response: response.result("getSaleSourcesReference").get(
+                "SaleSourcesReference", {}
+            ),
+        )
+
+    def storages(self) -> dict:
+        return self._fetch(
+            "get_storages",
+            "getStoragesReference:full",
+            lambda response: response.result("getStoragesReference:full").get(
+                "StoragesReference", {}
+            ),
+        )
+
+    def managers(self) -> dict:
+        return self._fetch(
+            "get_managers",
+            "getUsersReference",
+            lambda response: response.result("getUsersReference").get(
+                "UsersReference", {}
+            ),
+        )
+
+    def pay_sources(self) -> list:
+        return self._fetch(
+            "get_pay_sources",
+            "getPaySources",
+            lambda response: response.entities("getPaySources", "PaySourcesList"),
+        )
+
+    def cash_machines(self):
+        return self._fetch(
+            "get_cash_machines", "getCashMachines", lambda response: response.json()
+        )
+
+    def invalidate(self):
+        for method in (
+            "get_sources",
+            "get_storages",
+            "get_managers",
+            "get_pay_sources",
+            "get_cash_machines",
+        ):
+            self.cache.invalidate(method)
@@ -1,7 +1,6 @@
 from celery import shared_task
 from django.forms import model_to_dict
 from bazon.models import BazonAccount, SaleDocument, Contractor
-from utils.bazon_api import Bazon
 from .events import (
     on_create_sale_document,
     on_update_sale_document,
@@ -9,22 +8,19 @@ from .events import (
     on_update_contractor,
 )
 from django.db import transaction
+from utils.rate_limit import background_priority
 
 
 @shared_task
+@background_priority()
 def sale_documents_polling():
     return
     for bazon_account in BazonAccount.objects.all():
-        bazon_api = Bazon(
-            login=bazon_account.login,
-            password=bazon_account.password,
-            refresh_token=bazon_account.refresh_token,
-            access_token=bazon_account.access_token,
-        )
+        bazon_api = bazon_account.get_api()
         params = {"limit": 50}
         response = bazon_api.get_sale_documents(params=params)
         if response.status_code != 200:
-            bazon_account.refresh_auth()
+            bazon_account.refresh_auth(bazon_api.get_access_token())
             return
 
         for amo_account in bazon_account.amo_accounts.all():
@@ -65,15 +61,11 @@ def sale_documents_polling():
 
 
 @shared_task
+@background_priority()
 def contractors_polling():
     return
     for bazon_account in BazonAccount.objects.all():
-        bazon_api = Bazon(
-            login=bazon_account.login,
-            password=bazon_account.password,
-            refresh_token=bazon_account.refresh_token,
-            access_token=bazon_account.access_token,
-        )
+        bazon_api = bazon_account.get_api()
         response = bazon_api.get_contractors(limit=10)
         for amo_account in bazon_account.amo_accounts.all():
             data = response.json()
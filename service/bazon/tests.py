@@ -1,3 +1,306 @@
-from django.test import TestCase
+# Запуск: DATABASE_URL=sqlite:////tmp/test.sqlite3 python manage.py test bazon.tests
+# (на sqlite GIN-индексы каталога не создаются, см. utils/migrations.py)
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from amo.models import AmoAccount
+from utils.resilience import CircuitBreaker, resilient_call
+from .locks import _LeaseReaper
+from .models import AmoOutbox, BazonAccount, SaleDocument
+from .outbox import OutboxDispatcher, enqueue, enqueue_many, merge_pending
+from .polling.sale_documents import normalize_sale_documents, sync_sale_documents
 
-# Create your tests here.
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        with mock.patch.object(BazonAccount, "auth"):
+            self.bazon_account = BazonAccount.objects.create(
+                name="bazon", login="login", password="password"
+            )
+        self.amo_account = AmoAccount.objects.create(
+            suburl="amo", token="token", config=json.dumps({"bazon_field": 42})
+        )
+        self.client = mock.Mock()
+        self.client.create_deals.side_effect = lambda leads: (
+            {key: 1000 + key for key in leads},
+            {},
+        )
+        self.client.update_deals.side_effect = lambda leads: (set(leads), {})
+        self.client.find_deals.return_value = []
+        patcher = mock.patch.object(
+            AmoAccount, "get_deal_client", return_value=self.client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_document(self, internal_id: int, **fields) -> SaleDocument:
+        return SaleDocument.objects.create(
+            bazon_account=self.bazon_account,
+            amo_account=self.amo_account,
+            internal_id=internal_id,
+            number=str(internal_id),
+            **fields,
+        )
+
+    def enqueue_update(self, sale_document: SaleDocument, lead: dict, **kwargs):
+        enqueue(
+            self.amo_account,
+            AmoOutbox.UPDATE_LEAD,
+            f"lead:{sale_document.pk}",
+            {"sale_document_id": sale_document.pk, "lead": lead},
+            **kwargs,
+        )
+
+    def enqueue_create(self, sale_document: SaleDocument, lead: dict):
+        enqueue(
+            self.amo_account,
+            AmoOutbox.CREATE_LEAD,
+            f"lead:create:{sale_document.pk}",
+            {"sale_document_id": sale_document.pk, "lead": lead},
+        )
+
+
+class EnqueueTests(OutboxTestCase):
+    def test_pending_entries_with_same_key_are_merged(self):
+        sale_document = self.create_document(1, amo_lead_id=10)
+        self.enqueue_update(sale_document, {"name": "a", "price": 1})
+        self.enqueue_update(sale_document, {"name": "b"})
+
+        entry = AmoOutbox.objects.get()
+        self.assertEqual(entry.version, 1)
+        # Payload - полное состояние, старые поля сделки не остаются
+        self.assertEqual(entry.payload["lead"], {"name": "b"})
+
+    def test_merge_pending_without_pending_entry(self):
+        self.assertFalse(merge_pending(self.amo_account, "lead:1", {"lead": {}}))
+
+    def test_done_entry_is_not_merged(self):
+        sale_document = self.create_document(1, amo_lead_id=10)
+        self.enqueue_update(sale_document, {"name": "a"})
+        AmoOutbox.objects.update(status=AmoOutbox.DONE)
+        self.enqueue_update(sale_document, {"name": "b"})
+
+        self.assertEqual(AmoOutbox.objects.filter(status=AmoOutbox.PENDING).count(), 1)
+
+    def test_delay_is_extended_up_to_max_delay(self):
+        sale_document = self.create_document(1, amo_lead_id=10)
+        self.enqueue_update(sale_document, {"name": "a"}, delay=3, max_delay=5)
+        # Прошло 4 секунды: следующее изменение откладывает отправку не дальше max_delay
+        AmoOutbox.objects.update(
+            created_at=F("created_at") - timedelta(seconds=4),
+            available_at=F("available_at") - timedelta(seconds=4),
+        )
+        self.enqueue_update(sale_document, {"name": "b"}, delay=3, max_delay=5)
+
+        entry = AmoOutbox.objects.get()
+        self.assertGreater(entry.available_at, timezone.now())
+        self.assertEqual(entry.available_at, entry.created_at + timedelta(seconds=5))
+
+
+    def test_enqueue_many_merges_existing_and_creates_new(self):
+        first = self.create_document(1, amo_lead_id=10)
+        second = self.create_document(2, amo_lead_id=20)
+        self.enqueue_update(first, {"name": "a"})
+
+        enqueue_many(
+            self.amo_account,
+            AmoOutbox.UPDATE_LEAD,
+            {
+                f"lead:{first.pk}": {"lead": {"name": "b"}},
+                f"lead:{second.pk}": {"lead": {"name": "c"}},
+            },
+        )
+
+        entries = {entry.dedupe_key: entry for entry in AmoOutbox.objects.all()}
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[f"lead:{first.pk}"].payload["lead"], {"name": "b"})
+        self.assertEqual(entries[f"lead:{first.pk}"].version, 1)
+        self.assertEqual(entries[f"lead:{second.pk}"].payload, {"lead": {"name": "c"}})
+
+
+class SyncSaleDocumentsTests(OutboxTestCase):
+    def test_changed_page_fetches_each_contractor_once(self):
+        for internal_id in (1, 2, 3):
+            self.create_document(internal_id, amo_lead_id=internal_id, contractor_id=5)
+        records = normalize_sale_documents(
+            [
+                {"id": internal_id, "number": f"new {internal_id}", "contractor_id": 5}
+                for internal_id in (1, 2, 3)
+            ]
+        )
+        api = mock.Mock()
+        api.get_contractor.return_value.result.return_value = {"Contractor": None}
+
+        with mock.patch.object(BazonAccount, "get_api", return_value=api):
+            failed = sync_sale_documents(records, self.bazon_account, self.amo_account)
+
+        self.assertEqual(failed, set())
+        api.get_contractor.assert_called_once_with(5)
+        self.assertEqual(
+            AmoOutbox.objects.filter(kind=AmoOutbox.UPDATE_LEAD).count(), 3
+        )
+
+
+class DispatcherTests(OutboxTestCase):
+    def test_claim_skips_entries_locked_by_another_dispatcher(self):
+        sale_document = self.create_document(1, amo_lead_id=10)
+        self.enqueue_update(sale_document, {"name": "a"})
+        dispatcher = OutboxDispatcher()
+
+        self.assertEqual(len(dispatcher.claim()), 1)
+        self.assertEqual(dispatcher.claim(), [])
+
+    def test_create_and_update_are_sent_in_batches(self):
+        created = self.create_document(1)
+        updated = self.create_document(2, amo_lead_id=20)
+        self.enqueue_create(created, {"name": "a"})
+        self.enqueue_update(updated, {"name": "b"})
+
+        OutboxDispatcher().run_once()
+
+        self.client.find_deals.assert_not_called()
+        self.client.update_deals.assert_called_once_with({20: {"name": "b"}})
+        created.refresh_from_db()
+        self.assertEqual(created.amo_lead_id, 1000 + AmoOutbox.objects.first().pk)
+        self.assertFalse(AmoOutbox.objects.exclude(status=AmoOutbox.DONE).exists())
+
+    def test_update_before_lead_is_created_waits(self):
+        sale_document = self.create_document(1)
+        self.enqueue_update(sale_document, {"name": "a"})
+
+        OutboxDispatcher().run_once()
+
+        entry = AmoOutbox.objects.get()
+        self.assertEqual(entry.status, AmoOutbox.PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.available_at, timezone.now())
+        self.client.update_deals.assert_not_called()
+
+    def test_entry_merged_during_dispatch_is_sent_again(self):
+        sale_document = self.create_document(1, amo_lead_id=10)
+        self.enqueue_update(sale_document, {"name": "a"})
+        dispatcher = OutboxDispatcher()
+        entries = dispatcher.claim()
+        self.enqueue_update(sale_document, {"name": "b"})
+
+        dispatcher.dispatch(entries)
+
+        entry = AmoOutbox.objects.get()
+        self.assertEqual(entry.status, AmoOutbox.PENDING)
+        self.assertIsNone(entry.locked_until)
+        dispatcher.run_once()
+        self.client.update_deals.assert_called_with({10: {"name": "b"}})
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, AmoOutbox.DONE)
+
+    @override_settings(AMO_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failing_entry_is_retried_then_dead(self):
+        sale_document = self.create_document(1, amo_lead_id=10)
+        self.enqueue_update(sale_document, {"name": "a"})
+        self.client.update_deals.side_effect = RuntimeError("amo 500")
+        dispatcher = OutboxDispatcher()
+
+        dispatcher.run_once()
+        entry = AmoOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), (AmoOutbox.PENDING, 1))
+        self.assertIn("amo 500", entry.last_error)
+
+        AmoOutbox.objects.update(available_at=timezone.now())
+        dispatcher.run_once()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), (AmoOutbox.DEAD, 2))
+
+    def test_retried_create_finds_lead_instead_of_creating_it(self):
+        sale_document = self.create_document(7)
+        self.enqueue_create(sale_document, {"name": "a"})
+        # Прошлый диспетчер упал после запроса в amo
+        AmoOutbox.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.client.find_deals.return_value = [
+            {"id": 5, "custom_fields_values": []},
+            {
+                "id": 70,
+                "custom_fields_values": [{"field_id": 42, "values": [{"value": "7"}]}],
+            },
+        ]
+
+        OutboxDispatcher().run_once()
+
+        self.client.find_deals.assert_called_once_with("7")
+        self.client.create_deals.assert_not_called()
+        self.client.update_deals.assert_called_once_with({70: {"name": "a"}})
+        sale_document.refresh_from_db()
+        self.assertEqual(sale_document.amo_lead_id, 70)
+
+    def test_retried_create_not_found_in_amo_is_created(self):
+        sale_document = self.create_document(7)
+        self.enqueue_create(sale_document, {"name": "a"})
+        AmoOutbox.objects.update(attempts=1)
+
+        OutboxDispatcher().run_once()
+
+        self.client.find_deals.assert_called_once_with("7")
+        self.client.create_deals.assert_called_once()
+        sale_document.refresh_from_db()
+        self.assertIsNotNone(sale_document.amo_lead_id)
+
+
+class CircuitBreakerTests(TestCase):
+    def test_cache_failure_keeps_breaker_closed(self):
+        broken_cache = mock.Mock()
+        for method in ("get_many", "add", "incr", "set", "delete_many"):
+            getattr(broken_cache, method).side_effect = ConnectionError("redis down")
+        breaker = CircuitBreaker("bazon:test:getSaleDocuments")
+        response = mock.Mock(status_code=500)
+
+        with mock.patch("utils.resilience.cache", broken_cache):
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            for _ in range(breaker.failure_threshold + 1):
+                self.assertIs(resilient_call(lambda: response, breaker), response)
+            breaker._half_open = True
+            breaker.record_failure()
+            breaker.record_success()
+
+
+class BulkItemsViewTests(TestCase):
+    def setUp(self):
+        AmoAccount.objects.create(suburl="amo", token="token")
+
+    def post(self, url: str, data: dict):
+        return self.client.post(
+            f"/amo-bazon/bazon-sale/1/{url}",
+            data,
+            content_type="application/json",
+            headers={"Origin": "https://amo.amocrm.ru"},
+        )
+
+    def test_empty_batch_is_rejected(self):
+        for url, data in (
+            ("add-item", {"dealId": 1, "items": []}),
+            ("delete-items", {"itemIds": []}),
+            ("items-reprice", {"items": {}}),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.post(url, data).status_code, 400)
+
+    def test_add_item_rejects_non_object_items(self):
+        response = self.post("add-item", {"dealId": 1, "items": [{"productId": 1}, 5]})
+        self.assertEqual(response.status_code, 400)
+
+
+class LeaseReaperTests(TestCase):
+    @override_settings(DOCUMENT_LOCK_IDLE_TIMEOUT=0)
+    def test_repeated_mutations_share_one_release(self):
+        released = threading.Event()
+        reaper = _LeaseReaper()
+        with mock.patch(
+            "bazon.locks._release_if_idle", side_effect=lambda *args: released.set()
+        ) as release_if_idle:
+            for _ in range(3):
+                reaper.schedule(mock.sentinel.bazon_account, "1:7")
+            self.assertTrue(released.wait(timeout=5))
+
+        release_if_idle.assert_called_once_with(mock.sentinel.bazon_account, "1:7")
@@ -0,0 +1,137 @@
+import base64
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from loguru import logger
+from redis.exceptions import LockNotOwnedError
+from utils.bazon_api import Bazon
+
+
+def _token_expires_at(access_token: str) -> float:
+    """Срок жизни берем из exp JWT, если токен не JWT - считаем по настройке."""
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return time.time() + settings.BAZON_ACCESS_TOKEN_TTL
+
+
+class BazonTokenManager:
+    """
+    Общий для всех процессов кеш токенов аккаунта Bazon в Redis.
+    Обновляет токены заранее, до истечения, и ровно одним процессом:
+    остальные ждут на redis-локе и берут уже обновленный токен из кеша.
+    """
+
+    # Запас к худшему времени обновления на локе
+    LOCK_MARGIN = 30
+
+    def __init__(self, bazon_account):
+        self.bazon_account = bazon_account
+        self._key = f"bazon:tokens:{bazon_account.pk}"
+
+    @classmethod
+    def lock_timeout(cls) -> float:
+        """
+        Лок должен пережить худший случай обновления: refresh_me и затем логин,
+        каждый - до RETRY_ATTEMPTS попыток с таймаутами соединения и чтения
+        и паузой между ними. Иначе лок истечет посреди обновления и второй
+        процесс пойдет обновляться с уже отозванным RT.
+        """
+        call = (
+            settings.BAZON_HTTP_CONNECT_TIMEOUT
+            + settings.BAZON_HTTP_READ_TIMEOUT
+            + settings.RETRY_MAX_BACKOFF
+        )
+        return 2 * settings.RETRY_ATTEMPTS * call + cls.LOCK_MARGIN
+
+    def get_tokens(self) -> dict | None:
+        tokens = cache.get(self._key)
+        if tokens is None:
+            if not self.bazon_account.access_token:
+                return None
+            tokens = self._store(
+                self.bazon_account.access_token,
+                self.bazon_account.refresh_token,
+                persist=False,
+            )
+        expires_in = tokens["expires_at"] - time.time()
+        if expires_in < settings.BAZON_TOKEN_REFRESH_MARGIN:
+            # Пока токен жив, ждать чужое обновление незачем
+            tokens = (
+                self.refresh(tokens["AT"], blocking=expires_in <= 0) or tokens
+            )
+        return tokens
+
+    def refresh(
+        self, stale_access_token: str | None = None, blocking: bool = True
+    ) -> dict | None:
+        """
+        Обновляет токены, если в кеше все еще лежит stale_access_token.
+        Если его уже сменил другой процесс - просто отдает свежие из кеша.
+        """
+        lock = cache.lock(f"{self._key}:lock", timeout=self.lock_timeout())
+        # Ждем не дольше BAZON_TOKEN_LOCK_WAIT: лок живет до lock_timeout(),
+        # и зависший держатель не должен вешать все процессы на минуты
+        if not lock.acquire(
+            blocking=blocking, blocking_timeout=settings.BAZON_TOKEN_LOCK_WAIT
+        ):
+            if blocking:
+                logger.warning(
+                    f"Не дождались обновления токенов Bazon для {self.bazon_account}, "
+                    f"берем токены из кеша"
+                )
+            return cache.get(self._key)
+        try:
+            tokens = cache.get(self._key) or {}
+            if tokens and tokens["AT"] != stale_access_token:
+                return tokens
+            logger.info(f"Обновление токенов Bazon для {self.bazon_account}")
+            return self._store(
+                *self._issue_tokens(
+                    tokens.get("RT") or self.bazon_account.refresh_token,
+                    tokens.get("AT") or self.bazon_account.access_token,
+                )
+            )
+        finally:
+            try:
+                lock.release()
+            except LockNotOwnedError:
+                # Токены уже в кеше, теряем только лок
+                logger.warning(
+                    f"Лок обновления токенов Bazon для {self.bazon_account} истек до конца обновления"
+                )
+
+    def _issue_tokens(
+        self, refresh_token: str | None, access_token: str | None
+    ) -> tuple[str, str]:
+        account = self.bazon_account
+        if refresh_token:
+            bazon = Bazon(account.login, account.password, refresh_token, access_token)
+            try:
+                bazon.refresh_me()
+                return bazon.get_access_token(), bazon.get_refresh_token()
+            except Exception as error:
+                logger.warning(
+                    f"Не удалось обновить токены Bazon для {account}, логинимся заново: {error}"
+                )
+        bazon = Bazon(login=account.login, password=account.password)
+        return bazon.get_access_token(), bazon.get_refresh_token()
+
+    def _store(self, access_token: str, refresh_token: str, persist=True) -> dict:
+        tokens = {
+            "AT": access_token,
+            "RT": refresh_token,
+            "expires_at": _token_expires_at(access_token),
+        }
+        cache.set(self._key, tokens, timeout=None)
+        if persist:
+            # Строка в БД - только резервная копия на случай очистки Redis
+            type(self.bazon_account).objects.filter(pk=self.bazon_account.pk).update(
+                access_token=access_token, refresh_token=refresh_token
+            )
+        self.bazon_account.access_token = access_token
+        self.bazon_account.refresh_token = refresh_token
+        return tokens
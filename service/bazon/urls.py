@@ -2,10 +2,13 @@ from django.urls import path
 from .views import (
     BazonSaleView,
     BazonSaleDetailView,
+    BazonSaleOverviewView,
     BazonSalesListView,
     BazonItemsListView,
     BazonItemsAddView,
     BazonDeleteItemView,
+    BazonDeleteItemsView,
+    BazonItemsRepriceView,
     BazonDealOrdersView,
     BazonMoveSaleView,
     BazonAddSalePayView,
@@ -33,10 +36,13 @@ from .views import (
 urlpatterns = [
     path("bazon-sale/<int:amo_id>", BazonSaleView.as_view()),
     path("bazon-sale/<int:amo_id>/detail", BazonSaleDetailView.as_view()),
+    path("bazon-sale/<int:amo_lead_id>/overview", BazonSaleOverviewView.as_view()),
     path("bazon-sales", BazonSalesListView.as_view()),
     path("bazon-items/<str:amo_url>", BazonItemsListView.as_view()),
     path("bazon-sale/<int:amo_lead_id>/add-item", BazonItemsAddView.as_view()),
     path("bazon-sale/<int:amo_lead_id>/delete-item", BazonDeleteItemView.as_view()),
+    path("bazon-sale/<int:amo_lead_id>/delete-items", BazonDeleteItemsView.as_view()),
+    path("bazon-sale/<int:amo_lead_id>/items-reprice", BazonItemsRepriceView.as_view()),
     path("bazon-sale/<int:amo_lead_id>/orders", BazonDealOrdersView.as_view()),
     path("bazon-sale/<int:amo_lead_id>/move", BazonMoveSaleView.as_view()),
     path("bazon-sale/<int:amo_lead_id>/add-pay", BazonAddSalePayView.as_view()),
@@ -1,10 +1,11 @@
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.response import Response
 from rest_framework.status import *
 from rest_framework.views import APIView
 from loguru import logger
 from utils.bazon_api import Bazon
-from .models import SaleDocument, BazonAccount
+from .models import SaleDocument, BazonAccount, CatalogStorage
 from .serializers import (
     BazonSaleDocumentSerializer,
     AddSalePaySerializer,
@@ -15,9 +16,9 @@ from .serializers import (
 )
 from amo.models import AmoAccount
 from utils.serializers.bazon_serializers import ItemsListSerializer
-from .mixins import OriginCheckMixin, SaleDocumentMixin, BazonApiMixin
-import json
+from .mixins import OriginCheckMixin, SaleDocumentMixin, BazonApiMixin, BulkItemsMixin
 from .events import on_update_sale_document
+from .reference import BazonReferenceError
 from rest_framework.request import Request
 from rest_framework.exceptions import APIException
 
@@ -54,14 +55,10 @@ class BazonSaleDetailView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         response = bazon_api.get_detail_document(int(sale_document.number))
 
         if response.status_code == 200:
-            data = response.json()
-            logger.debug(f"Сделка получена: {data}")
+            logger.debug(f"Сделка получена: {response.text}")
             validated_data = {
-                "document": data["response"]["getDocument"],
-                "items": data.get("response", {})
-                .get("getDocumentItems", {})
-                .get("DocumentItemsList", {})
-                .get("entitys", []),
+                "document": response.result("getDocument"),
+                "items": response.entities("getDocumentItems", "DocumentItemsList"),
             }
             logger.info(
                 f"{subdomain}: BazonSaleDetailView - Успешное получение деталей документа"
@@ -72,6 +69,55 @@ class BazonSaleDetailView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         return self.return_response(response)
 
 
+class BazonSaleOverviewView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
+    """
+    Все данные экрана сделки в виджете одним запросом к Bazon.
+    """
+
+    def get(self, request, amo_lead_id):
+        subdomain = self.check_origin(request)
+        logger.info(f"{subdomain}: BazonSaleOverviewView - Начало обработки запроса")
+
+        sale_document = self.get_sale_document(amo_lead_id=amo_lead_id)
+        bazon_api = sale_document.get_api()
+
+        result = (
+            bazon_api.batch()
+            .get_document(sale_document.number)
+            .get_document_items(sale_document.number)
+            .get_paid_sources(sale_document.internal_id)
+            .get_receipts(sale_document.internal_id)
+            .get_pay_sources()
+            .get_cash_machines()
+            .execute()
+        )
+
+        if result.status_code != 200:
+            logger.error(
+                f"{subdomain}: BazonSaleOverviewView - Ошибка подключения к Bazon"
+            )
+            return self.return_response(result.response)
+
+        logger.info(f"{subdomain}: BazonSaleOverviewView - Данные сделки получены")
+        return Response(
+            {
+                "document": result["getDocument"],
+                "items": result["getDocumentItems"]
+                .get("DocumentItemsList", {})
+                .get("entitys", []),
+                "paid_sources": result["getDocumentPaidSources"].get(
+                    "paidSources", {}
+                ),
+                "receipts": result["getReceipts"],
+                "pay_sources": result["getPaySources"]
+                .get("PaySourcesList", {})
+                .get("entitys", []),
+                "cash_machines": result["getCashMachines"],
+            },
+            status=HTTP_200_OK,
+        )
+
+
 class BazonSalesListView(CustomAPIView):
 
     def get(self, request):
@@ -108,7 +154,7 @@ class BazonSalesListView(CustomAPIView):
         return Response(serializer.data, status=HTTP_200_OK)
 
 
-class BazonItemsListView(CustomAPIView):
+class BazonItemsListView(CustomAPIView, BazonApiMixin):
 
     def get(self, request, amo_url):
         subdomain = self.check_origin(request)
@@ -123,7 +169,6 @@ class BazonItemsListView(CustomAPIView):
             )
 
         bazon_account: BazonAccount = amo_account.bazon_accounts.first()
-        bazon_api = bazon_account.get_api()
         search = self.request.query_params.get("search")
         storage_id = self.request.query_params.get("storage_id")
 
@@ -131,8 +176,38 @@ class BazonItemsListView(CustomAPIView):
             logger.warning(f"{subdomain}: BazonItemsListView - Необходим storage id")
             return Response({"Error": "Need storage id"}, status=HTTP_400_BAD_REQUEST)
 
+        try:
+            offset = max(int(self.request.query_params.get("offset", 0)), 0)
+            limit = self.request.query_params.get("limit")
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            return Response(
+                {"Error": "Invalid offset or limit"}, status=HTTP_400_BAD_REQUEST
+            )
+
+        # Склады зеркала заводятся в админке, их наполняет catalog_polling
+        storage = CatalogStorage.objects.filter(
+            bazon_account=bazon_account, storage_id=int(storage_id)
+        ).first()
+        if storage is not None and storage.synced_at is not None:
+            search_limit = settings.CATALOG_SEARCH_LIMIT
+            items = storage.search(
+                search, offset=offset, limit=min(limit or search_limit, search_limit)
+            )
+            logger.info(
+                f"{subdomain}: BazonItemsListView - Найдено в каталоге: {len(items)}"
+            )
+            return Response(items, status=HTTP_200_OK)
+
+        logger.info(
+            f"{subdomain}: BazonItemsListView - Склада {storage_id} нет в каталоге, запрос в Bazon"
+        )
+        bazon_api = bazon_account.get_api()
         response = bazon_api.get_items(
-            limit=5000, search=search, storages_ids=[int(storage_id)]
+            offset=offset,
+            limit=min(limit or settings.BAZON_ITEMS_LIMIT, settings.BAZON_ITEMS_LIMIT),
+            search=search,
+            storages_ids=[int(storage_id)],
         )
 
         if response.status_code == 200:
@@ -146,10 +221,10 @@ class BazonItemsListView(CustomAPIView):
         logger.error(
             f"{subdomain}: BazonItemsListView - Ошибка при получении элементов: {response.status_code}"
         )
-        return Response(response.json(), status=HTTP_502_BAD_GATEWAY)
+        return self.return_response(response, status=HTTP_502_BAD_GATEWAY)
 
 
-class BazonItemsAddView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
+class BazonItemsAddView(CustomAPIView, SaleDocumentMixin, BulkItemsMixin):
 
     def post(self, request, amo_lead_id):
         subdomain = self.check_origin(request)
@@ -162,9 +237,13 @@ class BazonItemsAddView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
             return Response({"Error": "Need dealId"}, status=HTTP_400_BAD_REQUEST)
 
         items = data.get("items")
-        if not isinstance(items, list):
+        if (
+            not isinstance(items, list)
+            or not items
+            or not all(isinstance(item, dict) for item in items)
+        ):
             logger.warning(
-                f"{subdomain}: BazonItemsAddView - Ожидается массив идентификаторов элементов"
+                f"{subdomain}: BazonItemsAddView - Ожидается непустой массив элементов"
             )
             return Response(
                 {"Error": "Array of items expected"}, status=HTTP_400_BAD_REQUEST
@@ -174,58 +253,49 @@ class BazonItemsAddView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         bazon_account: BazonAccount = sale_document.bazon_account
         bazon_api = bazon_account.get_api()
 
-        with sale_document.generate_lock_key() as lock_key:
-            if not isinstance(lock_key, str):
-                logger.error(
-                    f"{subdomain}: BazonItemsAddView - Не удалось получить lock key"
-                )
-                raise APIException(detail="invalid_key_lock", code=403)
-
-            items_to_add = []
-            for item in items:
-                storage_id = item.get("storageId")
-                if storage_id is None:
-                    continue
-                product_id = item.get("productId")
-                if product_id is None:
-                    continue
-                amount = item.get("quantity")
-                if amount is None:
-                    continue
-
-                items_to_add.append(
-                    {
-                        "objectID": item.get("productId"),
-                        "objectType": "Product",
-                        "amount": amount,
-                        "storageID": storage_id,
-                        "id": "-1",
-                    }
-                )
-
-                item_to_add = [
+        results, items_to_add = [], []
+        for item in items:
+            storage_id = item.get("storageId")
+            product_id = item.get("productId")
+            amount = item.get("quantity")
+            result = {
+                "productId": product_id,
+                "storageId": storage_id,
+                "quantity": amount,
+            }
+            results.append(result)
+            if storage_id is None or product_id is None or amount is None:
+                result.update(status="skipped", error="missing_fields")
+                continue
+            items_to_add.append(
+                (
+                    result,
                     {
-                        "objectID": item.get("productId"),
+                        "objectID": product_id,
                         "objectType": "Product",
                         "amount": amount,
                         "storageID": storage_id,
                         "id": "-1",
-                    }
-                ]
-                response = bazon_api.add_item_to_document(
-                    lock_key, document_id=sale_document.internal_id, items=item_to_add
+                    },
                 )
-
-        if response.status_code == 200:
-            logger.info(
-                f"{subdomain}: BazonItemsAddView - Успешное добавление элементов"
             )
-            return self.return_response(response)
 
-        logger.error(
-            f"{subdomain}: BazonItemsAddView - Ошибка при добавлении элементов: {response.status_code}"
+        # Все позиции уходят одним saleAddItems (частями по BAZON_BULK_CHUNK_SIZE)
+        self.apply_in_chunks(
+            sale_document.generate_lock_key(),
+            [result for result, _ in items_to_add],
+            [payload for _, payload in items_to_add],
+            lambda lock_key, chunk: bazon_api.add_item_to_document(
+                lock_key, document_id=sale_document.internal_id, items=chunk
+            ),
+            "saleAddItems",
         )
-        return self.return_response(response)
+
+        added = sum(result.get("status") == "ok" for result in results)
+        logger.info(
+            f"{subdomain}: BazonItemsAddView - Добавлено элементов: {added} из {len(results)}"
+        )
+        return self.bulk_response(results)
 
 
 class BazonDeleteItemView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
@@ -269,6 +339,87 @@ class BazonDeleteItemView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         return self.return_response(response)
 
 
+class BazonDeleteItemsView(CustomAPIView, SaleDocumentMixin, BulkItemsMixin):
+
+    def post(self, request, amo_lead_id):
+        subdomain = self.check_origin(request)
+        logger.info(f"{subdomain}: BazonDeleteItemsView - Начало обработки запроса")
+
+        item_ids = request.data.get("itemIds")
+        if (
+            not isinstance(item_ids, list)
+            or not item_ids
+            or not all(isinstance(item_id, int) for item_id in item_ids)
+        ):
+            logger.warning(
+                f"{subdomain}: BazonDeleteItemsView - Ожидается массив идентификаторов элементов"
+            )
+            return Response(
+                {"Error": "Array of item ids expected"}, status=HTTP_400_BAD_REQUEST
+            )
+
+        sale_document = self.get_sale_document(amo_lead_id=amo_lead_id)
+        bazon_api = sale_document.get_api()
+
+        results = [{"itemId": item_id} for item_id in item_ids]
+        self.apply_in_chunks(
+            sale_document.generate_lock_key(),
+            results,
+            item_ids,
+            lambda lock_key, chunk: bazon_api.remove_document_items(
+                sale_document.internal_id, lock_key=lock_key, items=chunk
+            ),
+            "saleRemoveItems",
+        )
+
+        logger.info(
+            f"{subdomain}: BazonDeleteItemsView - Обработано элементов: {len(results)}"
+        )
+        return self.bulk_response(results)
+
+
+class BazonItemsRepriceView(CustomAPIView, SaleDocumentMixin, BulkItemsMixin):
+
+    def post(self, request, amo_lead_id):
+        subdomain = self.check_origin(request)
+        logger.info(f"{subdomain}: BazonItemsRepriceView - Начало обработки запроса")
+
+        # {"items": {"<id позиции>": <цена>, ...}} - как в items-edit-const
+        prices = request.data.get("items")
+        if (
+            not isinstance(prices, dict)
+            or not prices
+            or not all(isinstance(price, (int, float)) for price in prices.values())
+        ):
+            logger.warning(
+                f"{subdomain}: BazonItemsRepriceView - Ожидается словарь id позиции -> цена"
+            )
+            return Response(
+                {"Error": "Object of item id to price expected"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+
+        sale_document = self.get_sale_document(amo_lead_id=amo_lead_id)
+        bazon_api = sale_document.get_api()
+
+        pairs = [(str(item_id), price) for item_id, price in prices.items()]
+        results = [{"itemId": item_id, "price": price} for item_id, price in pairs]
+        self.apply_in_chunks(
+            sale_document.generate_lock_key(),
+            results,
+            pairs,
+            lambda lock_key, chunk: bazon_api.edit_item_cost(
+                dict(chunk), sale_document.internal_id, lock_key
+            ),
+            "saleEditItemCost",
+        )
+
+        logger.info(
+            f"{subdomain}: BazonItemsRepriceView - Обработано элементов: {len(results)}"
+        )
+        return self.bulk_response(results)
+
+
 class BazonDealOrdersView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
 
     def get(self, request, amo_lead_id):
@@ -284,13 +435,7 @@ class BazonDealOrdersView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
             logger.info(
                 f"{subdomain}: BazonDealOrdersView - Успешное получение заказов"
             )
-            return Response(
-                response.json()
-                .get("response", [{}])[0]
-                .get("result", {})
-                .get("orders", []),
-                status=HTTP_200_OK,
-            )
+            return Response(response.external_result("orders"), status=HTTP_200_OK)
 
         logger.error(
             f"{subdomain}: BazonDealOrdersView - Ошибка при получении заказов: {response.status_code}"
@@ -406,26 +551,18 @@ class BazonGetPaySourcesView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
 
         sale_document = self.get_sale_document(amo_lead_id)
 
-        bazon_api = sale_document.get_api()
-        response = bazon_api.get_pay_sources()
-
-        if response.status_code == 200:
-            response_json = response.json()
-            sources = (
-                response_json.get("response", {})
-                .get("getPaySources", {})
-                .get("PaySourcesList", {})
-                .get("entitys", [])
-            )
-            logger.info(
-                f"{subdomain}: BazonGetPaySourcesView - Успешное получение источников платежей"
+        try:
+            sources = sale_document.bazon_account.get_reference().pay_sources()
+        except BazonReferenceError as error:
+            logger.error(
+                f"{subdomain}: BazonGetPaySourcesView - Ошибка при получении источников платежей: {error.response.status_code}"
             )
-            return Response(sources, status=HTTP_200_OK)
+            return self.return_response(error.response)
 
-        logger.error(
-            f"{subdomain}: BazonGetPaySourcesView - Ошибка при получении источников платежей: {response.status_code}"
+        logger.info(
+            f"{subdomain}: BazonGetPaySourcesView - Успешное получение источников платежей"
         )
-        return self.return_response(response)
+        return Response(sources, status=HTTP_200_OK)
 
 
 class BazonGetPaidSourcesView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
@@ -442,14 +579,11 @@ class BazonGetPaidSourcesView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         response = bazon_api.get_paid_sources(sale_document.internal_id)
 
         if response.status_code == 200:
-            data = response.json()
             logger.info(
                 f"{subdomain}: Источники платежей успешно получены для сделки {amo_lead_id}"
             )
             return Response(
-                data.get("response", {})
-                .get("getDocumentPaidSources", {})
-                .get("paidSources", {}),
+                response.result("getDocumentPaidSources").get("paidSources", {}),
                 status=HTTP_200_OK,
             )
 
@@ -505,23 +639,17 @@ class BazonSourcesView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         subdomain = self.check_origin(request)
         logger.info(f"[{subdomain}] Запрос на получение источников заявок.")
         amo_account = AmoAccount.objects.get(suburl=subdomain)
-        api = amo_account.bazon_accounts.first().get_api()
-        response = api.get_sources()
-
-        if response.status_code != 200:
+        reference = amo_account.bazon_accounts.first().get_reference()
+        try:
+            sources = reference.sources()
+        except BazonReferenceError as error:
             logger.error(
-                f"[{subdomain}] Bazon ответил ошибкой при получении источников ({response.status_code})"
+                f"[{subdomain}] Bazon ответил ошибкой при получении источников ({error.response.status_code})"
             )
-            return self.return_response(response)
+            return self.return_response(error.response)
 
-        data = response.json()
         logger.info(f"[{subdomain}] Запрос на получение источников обработан.")
-        return Response(
-            data.get("response", {})
-            .get("getSaleSourcesReference", {})
-            .get("SaleSourcesReference", {}),
-            status=HTTP_200_OK,
-        )
+        return Response(sources, status=HTTP_200_OK)
 
 
 class BazonStoragesView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
@@ -531,22 +659,17 @@ class BazonStoragesView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
         subdomain = self.check_origin(request)
         logger.info(f"[{subdomain}] Запрос на получение складов.")
         amo_account = AmoAccount.objects.get(suburl=subdomain)
-        api = amo_account.bazon_accounts.first().get_api()
+        reference = amo_account.bazon_accounts.first().get_reference()
 
-        response = api.get_storages()
-        if response.status_code != 200:
+        try:
+            storages = reference.storages()
+        except BazonReferenceError as error:
             logger.error(
-                f"[{subdomain}] Bazon ответил ошибкой при попытке получить склады ({response.status_code})"
+                f"[{subdomain}] Bazon ответил ошибкой при попытке получить склады ({error.response.status_code})"
             )
-            return self.return_response(response)
+            return self.return_response(error.response)
 
-        data = response.json()
-        return Response(
-            data.get("response", {})
-            .get("getStoragesReference:full", {})
-            .get("StoragesReference", {}),
-            status=HTTP_200_OK,
-        )
+        return Response(storages, status=HTTP_200_OK)
 
 
 class BazonCreateDealView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
@@ -583,12 +706,10 @@ class BazonCreateDealView(CustomAPIView, SaleDocumentMixin, BazonApiMixin):
             )
             return self.return_response(response)
 
-        document_json = (
-            response.json().get("response", {}).get("saleCreate", {}).get("Document")
-        )
+        document_json = response.result("saleCreate").get("Document")
         if document_json is None:
             logger.error(
-                f"[{subdomain}] Не вышло получить сделку при создании {response.json()}"
+                f"[{subdomain}] Не вышло получить сделку при создании {response.text}"
             )
             return self.return_response(response)
         document_json["internal_id"] = document_json.pop("id")
@@ -609,21 +730,16 @@ class BazonManagersView(CustomAPIView, BazonApiMixin):
         subdomain = self.check_origin(request)
         logger.info(f"[{subdomain}] Запрос на получение менеджеров.")
         amo_account = AmoAccount.objects.get(suburl=subdomain)
-        api: Bazon = amo_account.bazon_accounts.first().get_api()
-        response = api.get_managers()
-        if response.status_code != 200:
+        reference = amo_account.bazon_accounts.first().get_reference()
+        try:
+            managers = reference.managers()
+        except BazonReferenceError as error:
             logger.warning(
-                f"[{subdomain}] При получении менеджеров Bazon ответил ошибкой ({response.status_code})"
+                f"[{subdomain}] При получении менеджеров Bazon ответил ошибкой ({error.response.status_code})"
             )
-            return self.return_response(response)
+            return self.return_response(error.response)
         logger.info(f"[{subdomain}] Запрос на получение менеджеров обрsаботан.")
-        return Response(
-            response.json()
-            .get("response", {})
-            .get("getUsersReference", {})
-            .get("UsersReference", {}),
-            status=HTTP_200_OK,
-        )
+        return Response(managers, status=HTTP_200_OK)
 
 
 class BazonPrintFromView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -636,27 +752,11 @@ class BazonPrintFromView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         api = sale_document.get_api()
 
         response = api.get_form_print(sale_document.internal_id)
-        if response.status_code != 200:
-            log = f"[{subdomain}] Bazon ответил ошибкой на получение чека и накладной {response.status_code}"
-            try:
-                log += f"\n {response.json()}"
-            except json.JSONDecodeError:
-                pass
-            logger.error(log)
-            return self.return_response(response)
-        html = (
-            response.json()
-            .get("response", {})
-            .get("getDocumentFormPrint", {})
-            .get("html")
-        )
-        if html is None:
-            log = f"[{subdomain}] Bazon ответил ошибкой на получение чека и накладной {response.status_code}"
-            try:
-                log += f"\n {response.json()}"
-            except json.JSONDecodeError:
-                pass
-            logger.error(log)
+        html = response.result("getDocumentFormPrint").get("html")
+        if response.status_code != 200 or html is None:
+            logger.error(
+                f"[{subdomain}] Bazon ответил ошибкой на получение чека и накладной {response.status_code}\n {response.text}"
+            )
             return self.return_response(response)
         return Response({"html": html})
 
@@ -675,7 +775,7 @@ class BazonSaleEditView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
                 sale_document=sale_document, amo_account=sale_document.amo_account
             )
             logger.debug(
-                f"[{subdomain}] Базон ответил на изменение сделки {response.json()} \n Тело запроса: {request.data}"
+                f"[{subdomain}] Базон ответил на изменение сделки {response.text} \n Тело запроса: {request.data}"
             )
 
         return self.return_response(response)
@@ -700,7 +800,7 @@ class BazonContractorsListView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
                 pass
         bazon_api = sale_docoument.get_api()
         response = bazon_api.get_contractors(offset, limit)
-        return Response(response.json(), response.status_code)
+        return self.return_response(response)
 
 
 class BazonContractorApiView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -717,9 +817,9 @@ class BazonContractorApiView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         api = sale_docoument.get_api()
         response = api.get_contractor(contractor_id)
         logger.info(
-            f"[{subdomain}] Получен контрагент с базона, статус ответа: {response.status_code}\nBody: {response.json()}"
+            f"[{subdomain}] Получен контрагент с базона, статус ответа: {response.status_code}\nBody: {response.text}"
         )
-        return Response(response.json(), response.status_code)
+        return self.return_response(response)
 
     def post(self, request, amo_lead_id: int):
         subdomain = self.check_origin(request)
@@ -728,11 +828,10 @@ class BazonContractorApiView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         api = sale_document.get_api()
         data = request.data
         response = api.set_contractor(**data)
-        response_json = response.json()
         on_update_sale_document(
             sale_document=sale_document, amo_account=sale_document.amo_account
         )
-        return Response(response_json, status=response.status_code)
+        return self.return_response(response)
 
 
 class BazonSaleUpdate(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -742,11 +841,9 @@ class BazonSaleUpdate(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         logger.info(f"[{subdomain}] Начало обработки запроса на обновление сделки")
         sale_document = self.get_sale_document(amo_lead_id)
         bazon_api = sale_document.get_api()
-        sale_document_data = bazon_api.get_detail_document(
-            int(sale_document.number)
-        ).json()
-        logger.debug(f"Акутализирую сделку - {sale_document_data}")
-        document_json = sale_document_data["response"]["getDocument"]["Document"]
+        response = bazon_api.get_detail_document(int(sale_document.number))
+        logger.debug(f"Акутализирую сделку - {response.text}")
+        document_json = response.result("getDocument")["Document"]
         document_json["internal_id"] = document_json.pop("id")
         try:
             on_update_sale_document(
@@ -769,7 +866,7 @@ class BazonItemEditCost(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
             response = bazon_api.edit_item_cost(
                 data.get("items"), sale_document.internal_id, lock_key
             )
-        return Response(data=response.json(), status=response.status_code)
+        return self.return_response(response)
 
 
 class BazonGetCashMachinesView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -778,9 +875,11 @@ class BazonGetCashMachinesView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         subdomain = self.check_origin(request)
         logger.debug(f"[{subdomain}] Начало обработки запроса на получение кеш машин")
         sale_document = self.get_sale_document(amo_lead_id)
-        api = sale_document.get_api()
-        response = api.get_cash_machines()
-        return Response(response.json(), response.status_code)
+        try:
+            cash_machines = sale_document.bazon_account.get_reference().cash_machines()
+        except BazonReferenceError as error:
+            return self.return_response(error.response)
+        return Response(cash_machines, status=HTTP_200_OK)
 
 
 class BazonCreateReceiptView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -802,7 +901,7 @@ class BazonCreateReceiptView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
                                            valid_data.get("cash"),
                                            valid_data.get("electron"),
                                            lock_key)
-        return Response(response.json(), response.status_code)
+        return self.return_response(response)
 
 class BazonRefundReceiptView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
 
@@ -823,7 +922,7 @@ class BazonRefundReceiptView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
                                            valid_data.get("cash"),
                                            valid_data.get("electron"),
                                            lock_key)
-        return Response(response.json(), response.status_code)
+        return self.return_response(response)
 
 class BazonGenerateReceiptRequest(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
     
@@ -838,7 +937,7 @@ class BazonGenerateReceiptRequest(CustomAPIView, BazonApiMixin, SaleDocumentMixi
         sale_document = self.get_sale_document(amo_lead_id)
         api = sale_document.get_api()
         response = api.generate_receipt_request(sale_document.internal_id, factory_number)
-        return Response(response.json(), response.status_code)
+        return self.return_response(response)
         
 
 class BazonReceiptState(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -849,7 +948,7 @@ class BazonReceiptState(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         sale_document = self.get_sale_document(amo_lead_id)
         api = sale_document.get_api()
         response = api.get_receipt_state(sale_document.internal_id, receipt_id)
-        return Response(response.json(), response.status_code)
+        return self.return_response(response)
     
 
 class BazonGetReceiptsView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
@@ -860,4 +959,4 @@ class BazonGetReceiptsView(CustomAPIView, BazonApiMixin, SaleDocumentMixin):
         sale_document = self.get_sale_document(amo_lead_id)
         api = sale_document.get_api()
         response = api.get_receipts(sale_document.internal_id)
-        return Response(response.json(), response.status_code)
\ No newline at end of file
+        return self.return_response(response)
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Сравнение задержки одного вызова Bazon: requests.post без сессии (как было)
+против общего keep-alive транспорта.
+
+    python -m benchmarks.bazon_transport --calls 500
+
+Заглушка работает по http, поэтому TLS-рукопожатие в замер не входит:
+на реальном kontrabaz.baz-on.ru разница будет заметно больше.
+"""
+
+import argparse
+import statistics
+import time
+import requests
+from django.conf import settings
+
+
+if not settings.configured:
+    settings.configure()
+
+from utils.bazon_api import Bazon  # noqa: E402
+from .stub_server import StubServer  # noqa: E402
+
+
+STUB_RESPONSE = {"response": {"getStoragesReference:full": {"StoragesReference": {}}}}
+
+
+def _measure(call, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def _report(name: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"{name:<12} mean={statistics.mean(timings):.3f}ms "
+        f"p50={statistics.median(timings):.3f}ms p95={p95:.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    with StubServer(STUB_RESPONSE) as stub:
+
+        class StubBazon(Bazon):
+            BASE_URL = stub.url
+
+        bazon = StubBazon("bench", "bench", "refresh", "access")
+        url = f"{stub.url}/frontend-api/?getStoragesReference"
+        payload = {"request": {"getStoragesReference:full": {"_": ""}}}
+        headers = {"Authorization": "Bearer access"}
+
+        old = _measure(
+            lambda: requests.post(url, json=payload, headers=headers), args.calls
+        )
+        new = _measure(bazon.get_storages, args.calls)
+
+    _report("per-call", old)
+    _report("pooled", new)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Время одного круга опроса сделок в зависимости от числа аккаунтов:
+последовательный обход (как было) против PollingScheduler с параллельными воркерами.
+
+    python -m benchmarks.polling_concurrency --accounts 1 5 10 25 50 --delay 0.05
+
+Каждый аккаунт за круг читает голову списка сделок с заглушки, которая отвечает
+через --delay секунд (задержка Bazon). БД в замер не входит.
+"""
+
+import argparse
+import time
+import django
+from django.conf import settings
+
+
+def _configure(concurrency: int, host_limit: int):
+    if settings.configured:
+        return
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "bazon",
+            "amo",
+        ],
+        DATABASES={
+            "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        },
+        SALE_POLLING_CONCURRENCY=concurrency,
+        SALE_POLLING_MIN_INTERVAL=5.0,
+        SALE_POLLING_MAX_INTERVAL=120.0,
+        SALE_POLLING_JITTER=0.2,
+        SALE_POLLING_ACCOUNTS_REFRESH=60,
+        BAZON_HOST_MAX_CONCURRENCY=host_limit,
+    )
+    django.setup()
+
+
+STUB_RESPONSE = {
+    "response": [
+        {
+            "result": {
+                "sale_documents": [
+                    {"id": number, "number": str(number), "status": "new"}
+                    for number in range(50, 0, -1)
+                ]
+            }
+        }
+    ]
+}
+
+
+class _Account:
+    def __init__(self, pk: int, api):
+        self.pk = pk
+        self.api = api
+
+    def __str__(self):
+        return f"bench{self.pk}"
+
+
+def _poll(account: _Account) -> int:
+    response = account.api.get_sale_documents(params={"limit": 50})
+    return len(response.external_result("sale_documents"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--host-limit", type=int, default=8)
+    args = parser.parse_args()
+    _configure(args.concurrency, args.host_limit)
+
+    from utils.bazon_api import Bazon
+    from bazon.polling.scheduler import PollingScheduler
+    from .stub_server import StubServer
+
+    with StubServer(STUB_RESPONSE, delay=args.delay) as stub:
+
+        class StubBazon(Bazon):
+            BASE_URL = stub.url
+
+        print(f"{'accounts':>8} {'sequential':>12} {'concurrent':>12}")
+        for count in args.accounts:
+            accounts = [
+                _Account(pk, StubBazon(f"bench{pk}", "bench", "refresh", "access"))
+                for pk in range(count)
+            ]
+            timings = []
+            for concurrency in (1, args.concurrency):
+                scheduler = PollingScheduler(
+                    _poll, lambda: accounts, concurrency=concurrency
+                )
+                scheduler.run_round()  # прогрев соединений
+                started = time.perf_counter()
+                results = scheduler.run_round()
+                timings.append((time.perf_counter() - started) * 1000)
+                assert all(results.values()), results
+            print(f"{count:>8} {timings[0]:>10.1f}ms {timings[1]:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
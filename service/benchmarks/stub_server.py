@@ -0,0 +1,58 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, чтобы клиент мог держать соединение открытым
+    protocol_version = "HTTP/1.1"
+    # иначе заголовки и тело уходят разными пакетами и ловят delayed ACK
+    disable_nagle_algorithm = True
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = json.dumps(self.server.payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class StubServer:
+    """Локальный HTTP-сервер, отвечающий фиксированным JSON на любой запрос."""
+
+    def __init__(self, payload: dict, delay: float = 0.0):
+        self._server = _StubHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.payload = payload
+        self._server.delay = delay
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
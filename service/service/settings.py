@@ -58,6 +58,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_celery_beat",
     "corsheaders",
     "celery",
@@ -170,3 +171,158 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": schedule(15.0),  # Каждые 15 секунд
     },
 }
+
+# Пул keep-alive соединений к Bazon (один на аккаунт в каждом процессе)
+BAZON_HTTP_POOL_CONNECTIONS = env.int("BAZON_HTTP_POOL_CONNECTIONS", default=4)
+BAZON_HTTP_POOL_MAXSIZE = env.int("BAZON_HTTP_POOL_MAXSIZE", default=10)
+BAZON_HTTP_CONNECT_TIMEOUT = env.float("BAZON_HTTP_CONNECT_TIMEOUT", default=5.0)
+BAZON_HTTP_READ_TIMEOUT = env.float("BAZON_HTTP_READ_TIMEOUT", default=30.0)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env.str("REDIS_CACHE_URL", default="redis://redis:6379/2"),
+        "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+    }
+}
+
+# Токены Bazon: обновляем за BAZON_TOKEN_REFRESH_MARGIN секунд до истечения.
+# BAZON_ACCESS_TOKEN_TTL - срок жизни, если его нельзя прочитать из самого токена
+BAZON_TOKEN_REFRESH_MARGIN = env.int("BAZON_TOKEN_REFRESH_MARGIN", default=120)
+BAZON_ACCESS_TOKEN_TTL = env.int("BAZON_ACCESS_TOKEN_TTL", default=3600)
+# Сколько секунд ждать чужое обновление токенов, потом берем токены из кеша
+BAZON_TOKEN_LOCK_WAIT = env.float("BAZON_TOKEN_LOCK_WAIT", default=5)
+
+# Лимиты запросов в секунду на аккаунт, общие для всех процессов.
+# RATE_LIMIT_INTERACTIVE_RESERVE - доля лимита, которую фоновые запросы не занимают
+BAZON_RATE_LIMIT = env.float("BAZON_RATE_LIMIT", default=10.0)
+AMO_RATE_LIMIT = env.float("AMO_RATE_LIMIT", default=7.0)
+RATE_LIMIT_INTERACTIVE_RESERVE = env.float(
+    "RATE_LIMIT_INTERACTIVE_RESERVE", default=0.3
+)
+
+# Пул keep-alive соединений к amo (один на аккаунт в каждом процессе)
+AMO_HTTP_POOL_CONNECTIONS = env.int("AMO_HTTP_POOL_CONNECTIONS", default=2)
+AMO_HTTP_POOL_MAXSIZE = env.int("AMO_HTTP_POOL_MAXSIZE", default=10)
+AMO_HTTP_CONNECT_TIMEOUT = env.float("AMO_HTTP_CONNECT_TIMEOUT", default=5.0)
+AMO_HTTP_READ_TIMEOUT = env.float("AMO_HTTP_READ_TIMEOUT", default=30.0)
+
+# Повторы идемпотентных чтений и предохранители для Bazon и amoCRM
+RETRY_ATTEMPTS = env.int("RETRY_ATTEMPTS", default=3)
+RETRY_BACKOFF = env.float("RETRY_BACKOFF", default=0.2)
+RETRY_MAX_BACKOFF = env.float("RETRY_MAX_BACKOFF", default=2.0)
+CIRCUIT_FAILURE_THRESHOLD = env.int("CIRCUIT_FAILURE_THRESHOLD", default=5)
+CIRCUIT_FAILURE_WINDOW = env.int("CIRCUIT_FAILURE_WINDOW", default=60)
+CIRCUIT_RECOVERY_TIMEOUT = env.int("CIRCUIT_RECOVERY_TIMEOUT", default=30)
+
+# Инкрементальный опрос сделок Bazon: голова списка до последнего виденного id
+# (не меньше SALE_DOCUMENTS_HEAD_WINDOW свежих документов) и раз в
+# SALE_DOCUMENTS_SWEEP_INTERVAL секунд одна страница скользящего окна по старым
+SALE_DOCUMENTS_HEAD_WINDOW = env.int("SALE_DOCUMENTS_HEAD_WINDOW", default=50)
+SALE_DOCUMENTS_INITIAL_LIMIT = env.int("SALE_DOCUMENTS_INITIAL_LIMIT", default=200)
+SALE_DOCUMENTS_SWEEP_PAGE_SIZE = env.int("SALE_DOCUMENTS_SWEEP_PAGE_SIZE", default=200)
+SALE_DOCUMENTS_SWEEP_INTERVAL = env.int("SALE_DOCUMENTS_SWEEP_INTERVAL", default=60)
+
+# Локальное зеркало каталога товаров: поиск в виджете идет по нему, а не в Bazon.
+# За проход читаются новые товары и до CATALOG_SWEEP_PAGES страниц обхода по кругу
+CATALOG_PAGE_SIZE = env.int("CATALOG_PAGE_SIZE", default=250)
+CATALOG_SWEEP_PAGES = env.int("CATALOG_SWEEP_PAGES", default=4)
+CATALOG_POLL_INTERVAL = env.float("CATALOG_POLL_INTERVAL", default=30.0)
+CATALOG_SEARCH_LIMIT = env.int("CATALOG_SEARCH_LIMIT", default=100)
+# Склада нет в зеркале - запрос getProducts идет в Bazon с прежним лимитом
+BAZON_ITEMS_LIMIT = env.int("BAZON_ITEMS_LIMIT", default=5000)
+# Ключи товара getProducts, где может лежать артикул: берется первый непустой
+CATALOG_PART_NUMBER_KEYS = env.list(
+    "CATALOG_PART_NUMBER_KEYS", default=["partNumber", "article", "oem"]
+)
+
+# Кеш справочников Bazon (источники, склады, менеджеры, кассы):
+# REFERENCE_CACHE_TTL секунд значение свежее, еще REFERENCE_CACHE_STALE_TTL
+# отдается устаревшим и обновляется в фоне. REFERENCE_CACHE_L1_TTL - кеш в памяти процесса
+REFERENCE_CACHE_TTL = env.int("REFERENCE_CACHE_TTL", default=3600)
+REFERENCE_CACHE_STALE_TTL = env.int("REFERENCE_CACHE_STALE_TTL", default=86400)
+REFERENCE_CACHE_L1_TTL = env.int("REFERENCE_CACHE_L1_TTL", default=30)
+
+# Аренда lock key документов Bazon: ключ живет, пока документ правят чаще, чем раз
+# в DOCUMENT_LOCK_IDLE_TIMEOUT секунд. Пока ключ не отпущен, документ закрыт
+# для правки в интерфейсе Bazon, поэтому срок короткий: его хватает на серию
+# запросов виджета подряд. DOCUMENT_LOCK_WAIT_TIMEOUT - сколько изменение
+# ждет очереди к документу, DOCUMENT_LOCK_MUTATION_TIMEOUT - предел одного изменения
+DOCUMENT_LOCK_IDLE_TIMEOUT = env.int("DOCUMENT_LOCK_IDLE_TIMEOUT", default=5)
+DOCUMENT_LOCK_WAIT_TIMEOUT = env.int("DOCUMENT_LOCK_WAIT_TIMEOUT", default=30)
+DOCUMENT_LOCK_MUTATION_TIMEOUT = env.int("DOCUMENT_LOCK_MUTATION_TIMEOUT", default=120)
+
+# Сколько позиций документа отправлять в Bazon одним запросом при пакетных изменениях.
+# Лимит позиций в запросе Bazon не документирует. Часть принимается или отклоняется
+# целиком, поэтому размер - компромисс между числом запросов под одним lock key
+# и числом позиций, получающих общую ошибку. Уменьшать, если Bazon отвечает
+# ошибкой или не укладывается в BAZON_HTTP_READ_TIMEOUT на больших частях
+BAZON_BULK_CHUNK_SIZE = env.int("BAZON_BULK_CHUNK_SIZE", default=100)
+
+# Планировщик опроса сделок: интервал аккаунта подстраивается под частоту изменений
+# в пределах SALE_POLLING_MIN_INTERVAL..SALE_POLLING_MAX_INTERVAL секунд (+-JITTER),
+# одновременно опрашивается не больше SALE_POLLING_CONCURRENCY аккаунтов
+SALE_POLLING_MIN_INTERVAL = env.float("SALE_POLLING_MIN_INTERVAL", default=5.0)
+SALE_POLLING_MAX_INTERVAL = env.float("SALE_POLLING_MAX_INTERVAL", default=120.0)
+SALE_POLLING_JITTER = env.float("SALE_POLLING_JITTER", default=0.2)
+SALE_POLLING_CONCURRENCY = env.int("SALE_POLLING_CONCURRENCY", default=16)
+SALE_POLLING_ACCOUNTS_REFRESH = env.int("SALE_POLLING_ACCOUNTS_REFRESH", default=60)
+
+# Сколько запросов процесс одновременно шлет на один хост Bazon (для всех аккаунтов)
+BAZON_HOST_MAX_CONCURRENCY = env.int("BAZON_HOST_MAX_CONCURRENCY", default=8)
+
+# Поля, от которых зависит то, что уходит в amo: по их отпечатку опрос решает,
+# изменилась ли сделка/контрагент. Изменения остальных полей не синхронизируются.
+# После смены списка все записи один раз обновятся в amo
+SALE_DOCUMENT_FINGERPRINT_FIELDS = env.list(
+    "SALE_DOCUMENT_FINGERPRINT_FIELDS",
+    default=[
+        "number",
+        "type",
+        "status",
+        "sum",
+        "storage_id",
+        "contractor_id",
+        "contractor_name",
+        "manager_id",
+        "manager_name",
+    ],
+)
+CONTRACTOR_FINGERPRINT_FIELDS = env.list(
+    "CONTRACTOR_FINGERPRINT_FIELDS",
+    default=[
+        "name",
+        "type",
+        "phone",
+        "email",
+        "manager_comment",
+        "balance_free",
+        "balance_reserve",
+        "balance",
+    ],
+)
+
+# Сколько amo-аккаунтов одного аккаунта Bazon сверяются с проходом опроса параллельно
+SALE_FANOUT_CONCURRENCY = env.int("SALE_FANOUT_CONCURRENCY", default=4)
+
+# Несколько процессов sale_documents_polling делят аккаунты через аренды в Redis.
+# Аренда и отметка живого процесса живут SALE_POLLING_LEASE_TTL секунд и продлеваются
+# каждую треть срока: за это время аккаунты упавшего процесса переходят к остальным
+SALE_POLLING_LEASE_TTL = env.int("SALE_POLLING_LEASE_TTL", default=30)
+
+# Очередь записей в amo (AmoOutbox): amo_outbox_dispatcher забирает по AMO_OUTBOX_BATCH_SIZE записей,
+# запись заблокирована за ним AMO_OUTBOX_LOCK_TIMEOUT секунд. Ошибка - повтор через
+# AMO_OUTBOX_RETRY_DELAY * 2^попытка (не больше AMO_OUTBOX_MAX_RETRY_DELAY) секунд,
+# после AMO_OUTBOX_MAX_ATTEMPTS попыток запись остается в статусе dead
+AMO_OUTBOX_BATCH_SIZE = env.int("AMO_OUTBOX_BATCH_SIZE", default=500)
+AMO_OUTBOX_POLL_INTERVAL = env.float("AMO_OUTBOX_POLL_INTERVAL", default=1.0)
+AMO_OUTBOX_LOCK_TIMEOUT = env.int("AMO_OUTBOX_LOCK_TIMEOUT", default=120)
+AMO_OUTBOX_RETRY_DELAY = env.int("AMO_OUTBOX_RETRY_DELAY", default=5)
+AMO_OUTBOX_MAX_RETRY_DELAY = env.int("AMO_OUTBOX_MAX_RETRY_DELAY", default=600)
+AMO_OUTBOX_MAX_ATTEMPTS = env.int("AMO_OUTBOX_MAX_ATTEMPTS", default=10)
+AMO_OUTBOX_RETENTION_DAYS = env.int("AMO_OUTBOX_RETENTION_DAYS", default=7)
+
+# Обновления одной сделки amo копятся AMO_LEAD_UPDATE_DEBOUNCE секунд после последнего
+# изменения (но не дольше AMO_LEAD_UPDATE_MAX_DELAY) и уходят одним PATCH
+AMO_LEAD_UPDATE_DEBOUNCE = env.float("AMO_LEAD_UPDATE_DEBOUNCE", default=3.0)
+AMO_LEAD_UPDATE_MAX_DELAY = env.float("AMO_LEAD_UPDATE_MAX_DELAY", default=30.0)
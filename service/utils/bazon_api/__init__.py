@@ -1 +1,4 @@
 from .api import Bazon
+from .batch import BazonBatch, BazonBatchResult
+from .pagination import BazonPaginator
+from .response import BazonResponse
@@ -1,44 +1,72 @@
+import functools
 import json
 import uuid
 from typing import Optional
-import requests
 from typing import Collection
 from loguru import logger
 from urllib3 import request
 from rest_framework.exceptions import APIException
+from utils.resilience import (
+    CircuitBreaker,
+    RetryPolicy,
+    resilient_call,
+)
+from .transport import get_transport
+from .batch import BazonBatch
+from .response import BazonResponse
+from .pagination import BazonPaginator
+
+
+def _check_response(func, response, args, kwargs) -> BazonResponse:
+    # Тело декодируется здесь один раз, вызывающий код получает уже разобранный ответ
+    response = BazonResponse(response)
+    if response.status_code == 500:
+        logger.error(f"Bazon response has 500 status code ({func.__name__}) \nargs({args}) \nkwargs({kwargs}) \ncontent - {response.content}")
+        raise APIException(detail="bazon response error", code=500)
+    try:
+        data: dict = response.json()
+    except json.JSONDecodeError as error:
+        logger.error(f"Error to parse response body ({func.__name__}) args({args}) kwargs({kwargs})\n{error}")
+        return response
+    response_data: dict = data.get("response", {})
+    try:
+        for key, response_item in response_data.items():
+            if error := response_item.get("error"):
+                logger.error( 
+                    f"Ошибочный ответ от базона по методу {func.__name__} args({args}) kwargs({kwargs}):\n{error}"
+                )
+                if error == "invalid_lock":
+                    raise APIException(detail="invalid_key_lock", code=403)
+    except APIException:
+        raise
+    except Exception as err:
+        pass
+    return response
+
+
+def bazon_response_check(func=None, *, idempotent: bool = False):
+    """
+    Запрос идет через предохранитель (аккаунт + метод), idempotent=True помечает
+    чтения, которые можно повторить при обрыве или 5xx.
+    """
+    if func is None:
+        return functools.partial(bazon_response_check, idempotent=idempotent)
 
-
-def bazon_response_check(func):
     def wrapper(*args, **kwargs):
-        response = func(*args, **kwargs)
-        if response.status_code == 500:
-            logger.error(f"Bazon response has 500 status code ({func.__name__}) \nargs({args}) \nkwargs({kwargs}) \ncontent - {response.content}")
-            raise APIException(detail="bazon response error", code=500)
-        try:
-            data: dict = response.json()
-        except requests.exceptions.JSONDecodeError as error:
-            logger.error(f"Error to parse response body ({func.__name__}) args({args}) kwargs({kwargs})\n{error}")
-            return response
-        response_data: dict = data.get("response", {})
-        try:
-            for key, response_item in response_data.items():
-                if error := response_item.get("error"):
-                    logger.error( 
-                        f"Ошибочный ответ от базона по методу {func.__name__} args({args}) kwargs({kwargs}):\n{error}"
-                    )
-                    if error == "invalid_lock":
-                        raise APIException(detail="invalid_key_lock", code=403)
-        except APIException:
-            raise
-        except Exception as err:
-            pass
-        return response
+        api = args[0]
+        breaker = api.get_circuit_breaker(func.__name__)
+        retry = RetryPolicy() if idempotent else None
+        response = resilient_call(lambda: func(*args, **kwargs), breaker, retry)
+        return _check_response(func, response, args, kwargs)
 
     return wrapper
 
 
 class Bazon:
 
+    AUTH_URL = "https://a.baz-on.ru"
+    BASE_URL = "https://kontrabaz.baz-on.ru"
+
     def __init__(
         self,
         login: str,
@@ -48,6 +76,7 @@ class Bazon:
     ):
         self._login = login
         self._password = password
+        self._session = get_transport(login)
         if refresh_token:
             self._refresh_token = refresh_token
             self._access_token = access_token
@@ -60,6 +89,9 @@ class Bazon:
                 raise ValueError(f"Error to get token {auth_data.status_code}")
         self._headers = {"Authorization": f"Bearer {self._access_token}"}
 
+    def get_circuit_breaker(self, method: str) -> CircuitBreaker:
+        return CircuitBreaker(f"bazon:{self._login}:{method}")
+
     def get_refresh_token(self):
         return self._refresh_token
 
@@ -67,23 +99,23 @@ class Bazon:
         return self._access_token
 
     @bazon_response_check
-    def get_auth_data(self) -> requests.Response:
-        url = "https://a.baz-on.ru/login/user"
+    def get_auth_data(self) -> BazonResponse:
+        url = f"{self.AUTH_URL}/login/user"
 
         payload = {"login": self._login, "password": self._password}
 
-        response = requests.post(url=url, json=payload)
+        response = self._session.post(url=url, json=payload)
         return response
 
     @bazon_response_check
     def refresh_tokens(self):
-        url = "https://a.baz-on.ru/refresh/user"
+        url = f"{self.AUTH_URL}/refresh/user"
 
         payload = {
             "RT": self._refresh_token,
         }
 
-        response = requests.post(url, headers=self._headers, json=payload)
+        response = self._session.post(url, headers=self._headers, json=payload)
         return response
 
     def refresh_me(self):
@@ -91,30 +123,31 @@ class Bazon:
         print(f"REFRESH: {refresh_data}\nREFRESH_DATA:{refresh_data.json()}")
         self._refresh_token = refresh_data.json()["RT"]
         self._access_token = refresh_data.json()["AT"]
+        self._headers = {"Authorization": f"Bearer {self._access_token}"}
 
-    @bazon_response_check
-    def get_sale_documents(self, params: dict = {}) -> requests.Response:
+    @bazon_response_check(idempotent=True)
+    def get_sale_documents(self, params: dict = {}) -> BazonResponse:
         if params.get("order") is None:
             params["order"] = "desc"
 
-        url = "https://kontrabaz.baz-on.ru/external-api/v1/getSaleDocuments"
+        url = f"{self.BASE_URL}/external-api/v1/getSaleDocuments"
 
-        response = requests.get(url, headers=self._headers, params=params)
+        response = self._session.get(url, headers=self._headers, params=params)
         return response
 
-    @bazon_response_check
-    def get_products(self, params: dict = {}) -> requests.Response:
+    @bazon_response_check(idempotent=True)
+    def get_products(self, params: dict = {}) -> BazonResponse:
         if params.get("order") is None:
             params["order"] = "desc"
-        url = "https://kontrabaz.baz-on.ru/external-api/v1/getProducts"
+        url = f"{self.BASE_URL}/external-api/v1/getProducts"
 
-        response = requests.get(url, headers=self._headers, params=params)
+        response = self._session.get(url, headers=self._headers, params=params)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_detail_document(
         self, document_id: int, params: dict = None
-    ) -> requests.Response:
+    ) -> BazonResponse:
         data = {
             "request": {
                 "getDocument": {"number": str(document_id), "type": "sale", "_": ""},
@@ -141,10 +174,9 @@ class Bazon:
                 },
             },
         }
-        headers = self._headers
-        headers["content-type"] = "text/plain"
-        response = requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getSaleSourcesReference,getCompanyConfig,7",
+        headers = {**self._headers, "content-type": "text/plain"}
+        response = self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getSaleSourcesReference,getCompanyConfig,7",
             headers=headers,
             data=json.dumps(data),
             params=params,
@@ -169,7 +201,7 @@ class Bazon:
         sum_full: int = 0,
     ):
         id = str(uuid.uuid4())[:23]
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "saleCreate": {
@@ -194,12 +226,12 @@ class Bazon:
             }
         }
 
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
     @bazon_response_check
     def set_lock_key(self, number: str, prev_lock_key=False, type: str = "sale"):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "setDocumentLock": {
@@ -209,32 +241,32 @@ class Bazon:
                 }
             }
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
     @bazon_response_check
     def sale_recreate(self, document_id: int, lock_key: str):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "saleRecreate": {"documentID": document_id, "lockKey": lock_key}
             }
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
     @bazon_response_check
     def cancel_sale(self, document_id: int, lock_key: str):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {"saleCancel": {"documentID": document_id, "lockKey": lock_key}}
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_users(self, offset: int, limit: int):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "getUsers": {
@@ -251,23 +283,23 @@ class Bazon:
                 }
             }
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_check(self, id: int, print_type: str = "default"):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "getDocumentFormPrint": {"id": id, "printType": print_type, "_": ""}
             }
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_document_items(self, document_number: str, document_type: str = "sale"):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "getDocumentItems": {
@@ -282,12 +314,12 @@ class Bazon:
                 }
             }
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
     @bazon_response_check
     def edit_sale(self, id: int, data_to_edit: dict, lock_key: str):
-        url = "https://kontrabaz.baz-on.ru/frontend-api/"
+        url = f"{self.BASE_URL}/frontend-api/"
         data = {
             "request": {
                 "saleEditData": {
@@ -299,10 +331,10 @@ class Bazon:
                 }
             }
         }
-        response = requests.post(url, json=data, headers=self._headers)
+        response = self._session.post(url, json=data, headers=self._headers)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_orders(
         self, offset: int = 0, limit: int = 500, for_sale_document: str = None
     ):
@@ -312,30 +344,30 @@ class Bazon:
         if for_sale_document is not None:
             params["for_sale_document"] = for_sale_document
 
-        url = "https://kontrabaz.baz-on.ru/external-api/v1/getOrders"
+        url = f"{self.BASE_URL}/external-api/v1/getOrders"
 
-        response = requests.get(url, params=params, headers=self._headers)
+        response = self._session.get(url, params=params, headers=self._headers)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_contractors(self, offset: int = 0, limit: int = 500):
         params = {"order": "desc", "limit": limit}
         if offset > 0:
             params["offset"] = offset
-        url = "https://kontrabaz.baz-on.ru/external-api/v1/getContractors"
-        response = requests.get(url, params=params, headers=self._headers)
+        url = f"{self.BASE_URL}/external-api/v1/getContractors"
+        response = self._session.get(url, params=params, headers=self._headers)
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_contractor(self, contractor_id: int):
 
         payload = {"request": {"getContractor": {"id": contractor_id}}}
 
-        url = "https://kontrabaz.baz-on.ru/frontend-api/?getContractor"
+        url = f"{self.BASE_URL}/frontend-api/?getContractor"
 
-        return requests.post(url, json=payload, headers=self._headers)
+        return self._session.post(url, json=payload, headers=self._headers)
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_items(
         self,
         offset: int = 0,
@@ -383,8 +415,8 @@ class Bazon:
         if search is not None:
             data["request"]["getProducts"]["searchByPartNumber"] = search
 
-        response = requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getProducts",
+        response = self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getProducts",
             json=data,
             headers=self._headers,
         )
@@ -437,8 +469,8 @@ class Bazon:
             },
         }
 
-        response = requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?saleAddItems",
+        response = self._session.post(
+            f"{self.BASE_URL}/frontend-api/?saleAddItems",
             headers=self._headers,
             json=data,
         )
@@ -456,14 +488,14 @@ class Bazon:
             }
         }
 
-        response = requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?dropDocumentLock",
+        response = self._session.post(
+            f"{self.BASE_URL}/frontend-api/?dropDocumentLock",
             headers=self._headers,
             json=data,
         )
         return response
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_document_items_by_buffer(self, items: list[dict]):
         """items
         [
@@ -499,8 +531,8 @@ class Bazon:
             },
         }
 
-        response = requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getDocumentItemsByBuffer",
+        response = self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getDocumentItemsByBuffer",
             headers=self._headers,
             json=data,
         )
@@ -531,8 +563,8 @@ class Bazon:
             },
         }
 
-        response = requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?saleRemoveItems",
+        response = self._session.post(
+            f"{self.BASE_URL}/frontend-api/?saleRemoveItems",
             headers=self._headers,
             json=data,
         )
@@ -541,7 +573,7 @@ class Bazon:
     @bazon_response_check
     def _sale_move(
         self, document_id: int, lock_key: str, method: str
-    ) -> requests.Response:
+    ) -> BazonResponse:
         data = {
             "request": {
                 method: {
@@ -550,8 +582,8 @@ class Bazon:
                 }
             }
         }
-        return requests.post(
-            f"https://kontrabaz.baz-on.ru/frontend-api/?{method}",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?{method}",
             headers=self._headers,
             json=data,
         )
@@ -565,15 +597,10 @@ class Bazon:
     def sale_issue(self, document_id: int, lock_key: str):
         return self._sale_move(document_id, lock_key, "saleIssue")
 
-    def generate_lock_key(self, document_number: str):
-        response = self.set_lock_key(document_number)
+    def generate_lock_key(self, document_number: str, prev_lock_key=False):
+        response = self.set_lock_key(document_number, prev_lock_key)
         response.raise_for_status()
-        lock_key = (
-            response.json()
-            .get("response", {})
-            .get("setDocumentLock", {})
-            .get("lockKey")
-        )
+        lock_key = response.result("setDocumentLock").get("lockKey")
         return lock_key
 
     @bazon_response_check
@@ -597,13 +624,13 @@ class Bazon:
             }
         }
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?salePay",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?salePay",
             headers=self._headers,
             json=payload,
         )
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_pay_sources(self):
 
         payload = {
@@ -616,19 +643,19 @@ class Bazon:
             }
         }
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getPaySources",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getPaySources",
             headers=self._headers,
             json=payload,
         )
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_paid_sources(self, document_id: int):
 
         payload = {"request": {"getDocumentPaidSources": {"documentID": document_id}}}
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getDocumentPaidSources",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getDocumentPaidSources",
             headers=self._headers,
             json=payload,
         )
@@ -650,45 +677,45 @@ class Bazon:
             }
         }
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?saleRefund",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?saleRefund",
             headers=self._headers,
             json=payload,
         )
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_sources(self):
         payload = {"request": {"getSaleSourcesReference": {"where": {"isArchive": 0}}}}
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getSaleSourcesReference",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getSaleSourcesReference",
             json=payload,
             headers=self._headers,
         )
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_storages(self):
 
         payload = {"request": {"getStoragesReference:full": {"_": ""}}}
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getStoragesReference",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getStoragesReference",
             json=payload,
             headers=self._headers,
         )
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_managers(self):
 
         payload = {"request": {"getUsersReference": {"_": ""}}}
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getUsersReference",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getUsersReference",
             json=payload,
             headers=self._headers,
         )
 
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_form_print(self, document_id: int, print_type: str = "default"):
 
         payload = {
@@ -697,8 +724,8 @@ class Bazon:
             }
         }
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?getDocumentFormPrint",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?getDocumentFormPrint",
             headers=self._headers,
             json=payload,
         )
@@ -742,8 +769,8 @@ class Bazon:
         if id:
             payload["request"]["setContractor"]["id"] = id
 
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?setContractor",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?setContractor",
             headers=self._headers,
             json=payload,
         )
@@ -759,13 +786,13 @@ class Bazon:
                 }
             }
         }
-        return requests.post(
-            "https://kontrabaz.baz-on.ru/frontend-api/?saleEditItemCost",
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?saleEditItemCost",
             headers=self._headers,
             json=data,
         )
     
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_cash_machines(self):
         data = {
             "request": {
@@ -774,8 +801,8 @@ class Bazon:
                 }
             }
         }
-        url = "https://kontrabaz.baz-on.ru/frontend-api/?getCashMachines"
-        return requests.post(url, headers=self._headers, json=data)
+        url = f"{self.BASE_URL}/frontend-api/?getCashMachines"
+        return self._session.post(url, headers=self._headers, json=data)
     
     @bazon_response_check
     def generate_receipt_request(self, document_id: int, factory_number: str):
@@ -796,9 +823,9 @@ class Bazon:
                 }
             }
         }
-        return requests.post("https://kontrabaz.baz-on.ru/frontend-api/?generateReceiptRequest,getOperations", headers=self._headers, json=data)
+        return self._session.post(f"{self.BASE_URL}/frontend-api/?generateReceiptRequest,getOperations", headers=self._headers, json=data)
     
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_receipt_state(self, document_id: int, receipt_id: int):
         data = {
             "request": {
@@ -808,9 +835,9 @@ class Bazon:
                 }
             }
         }
-        return requests.post("https://kontrabaz.baz-on.ru/frontend-api/?getReceiptState", headers=self._headers, json=data)
+        return self._session.post(f"{self.BASE_URL}/frontend-api/?getReceiptState", headers=self._headers, json=data)
     
-    @bazon_response_check
+    @bazon_response_check(idempotent=True)
     def get_receipts(self, document_id: int):
         data = {
             "request": {
@@ -825,7 +852,7 @@ class Bazon:
                 }
             }
         }
-        return requests.post("https://kontrabaz.baz-on.ru/frontend-api/?getReceipts", headers=self._headers, json=data)
+        return self._session.post(f"{self.BASE_URL}/frontend-api/?getReceipts", headers=self._headers, json=data)
 
     def receipt_pay(self, document_id: int, 
                              factory_number: str, 
@@ -873,4 +900,71 @@ class Bazon:
                 }
             }
         }
-        return requests.post("https://kontrabaz.baz-on.ru/frontend-api/?saleReceiptProcess", headers=self._headers, json=data)
\ No newline at end of file
+        return self._session.post(f"{self.BASE_URL}/frontend-api/?saleReceiptProcess", headers=self._headers, json=data)
+
+    @bazon_response_check
+    def frontend_batch(self, calls: dict[str, dict]):
+        methods = ",".join(method.split(":")[0] for method in calls)
+        return self._session.post(
+            f"{self.BASE_URL}/frontend-api/?{methods}",
+            headers=self._headers,
+            json={"request": calls},
+        )
+
+    def batch(self) -> BazonBatch:
+        return BazonBatch(self)
+
+    def iter_sale_documents(
+        self,
+        page_size: int = 200,
+        params: dict = None,
+        start: int = 0,
+        read_ahead: bool = False,
+    ) -> BazonPaginator:
+        return BazonPaginator(
+            lambda offset, limit: self.get_sale_documents(
+                params={**(params or {}), "offset": offset, "limit": limit}
+            ),
+            lambda response: response.external_result("sale_documents"),
+            page_size,
+            start,
+            read_ahead,
+        )
+
+    def iter_contractors(
+        self, page_size: int = 500, start: int = 0, read_ahead: bool = False
+    ) -> BazonPaginator:
+        return BazonPaginator(
+            self.get_contractors,
+            lambda response: response.external_result("contractors"),
+            page_size,
+            start,
+            read_ahead,
+        )
+
+    def iter_users(
+        self, page_size: int = 250, start: int = 0, read_ahead: bool = False
+    ) -> BazonPaginator:
+        return BazonPaginator(
+            self.get_users,
+            lambda response: response.entities("getUsers", "UsersList"),
+            page_size,
+            start,
+            read_ahead,
+        )
+
+    def iter_items(
+        self,
+        page_size: int = 250,
+        start: int = 0,
+        read_ahead: bool = False,
+        **filters,
+    ) -> BazonPaginator:
+        """filters - остальные параметры get_items (search, storages_ids, category_id...)"""
+        return BazonPaginator(
+            lambda offset, limit: self.get_items(offset=offset, limit=limit, **filters),
+            lambda response: response.entities("getProducts", "ProductsList"),
+            page_size,
+            start,
+            read_ahead,
+        )
@@ -0,0 +1,117 @@
+class BazonBatchResult:
+    """
+    Ответ пакетного запроса, разобранный по вызовам.
+    Ключ вызова - имя метода frontend-api (например, "getDocument").
+    """
+
+    def __init__(self, response, keys: list[str]):
+        self.response = response
+        self.keys = keys
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    def __getitem__(self, key: str) -> dict:
+        if key not in self.keys:
+            raise KeyError(key)
+        if self.response.status_code != 200:
+            return {}
+        return self.response.result(key)
+
+    def error(self, key: str):
+        return self[key].get("error")
+
+    def as_dict(self) -> dict[str, dict]:
+        return {key: self[key] for key in self.keys}
+
+
+class BazonBatch:
+    """
+    Собирает несколько вызовов frontend-api и отправляет их одним POST.
+
+        result = api.batch().get_document(number).get_receipts(doc_id).execute()
+        result["getDocument"], result["getReceipts"]
+    """
+
+    def __init__(self, api):
+        self._api = api
+        self._calls: dict[str, dict] = {}
+
+    def add(self, method: str, params: dict = None) -> "BazonBatch":
+        if method in self._calls:
+            raise ValueError(f"Method {method} already added to batch")
+        self._calls[method] = params if params is not None else {"_": ""}
+        return self
+
+    def __len__(self):
+        return len(self._calls)
+
+    def execute(self):
+        if not self._calls:
+            raise ValueError("Batch is empty")
+        keys = list(self._calls)
+        return BazonBatchResult(self._api.frontend_batch(self._calls), keys)
+
+    def get_document(self, number: str, type: str = "sale"):
+        return self.add("getDocument", {"number": str(number), "type": type, "_": ""})
+
+    def get_document_items(self, document_number: str, document_type: str = "sale"):
+        return self.add(
+            "getDocumentItems",
+            {
+                "order": {"id": "asc"},
+                "viewMode": "sale",
+                "where": {
+                    "documentNumber": str(document_number),
+                    "documentType": document_type,
+                    "state!=": ["removed", "removed_to_other_sale"],
+                },
+                "_": "",
+            },
+        )
+
+    def get_paid_sources(self, document_id: int):
+        return self.add("getDocumentPaidSources", {"documentID": document_id})
+
+    def get_pay_sources(self):
+        return self.add(
+            "getPaySources",
+            {
+                "viewMode": "raw",
+                "where": {"type": ["cash", "bank"]},
+                "sorter": {"sorter": "asc"},
+            },
+        )
+
+    def get_receipts(self, document_id: int):
+        return self.add(
+            "getReceipts",
+            {"where": {"documentID": document_id}, "order": {"id": "asc"}, "_": ""},
+        )
+
+    def get_operations(self, document_id: int):
+        return self.add(
+            "getOperations",
+            {"viewMode": "raw", "where": {"documentID": document_id}, "_": ""},
+        )
+
+    def get_form_print(self, document_id: int, print_type: str = "default"):
+        return self.add(
+            "getDocumentFormPrint", {"id": document_id, "printType": print_type}
+        )
+
+    def get_cash_machines(self):
+        return self.add("getCashMachines", {"viewMode": "raw"})
+
+    def get_contractor(self, contractor_id: int):
+        return self.add("getContractor", {"id": contractor_id})
+
+    def get_sources(self):
+        return self.add("getSaleSourcesReference", {"where": {"isArchive": 0}})
+
+    def get_storages(self):
+        return self.add("getStoragesReference:full", {"_": ""})
+
+    def get_managers(self):
+        return self.add("getUsersReference", {"_": ""})
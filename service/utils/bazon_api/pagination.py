@@ -0,0 +1,76 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from rest_framework.exceptions import APIException
+from .response import BazonResponse
+
+
+class BazonPaginator:
+    """
+    Ленивый обход постраничного метода Bazon.
+
+        for document in api.iter_sale_documents(page_size=200):
+            ...
+
+    В памяти держится одна страница (две с read_ahead: следующая грузится,
+    пока обрабатывается текущая). cursor - смещение следующей страницы,
+    его можно сохранить и продолжить обход с него через start=cursor.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[int, int], BazonResponse],
+        extract: Callable[[BazonResponse], list],
+        page_size: int,
+        start: int = 0,
+        read_ahead: bool = False,
+    ):
+        self._fetch_page = fetch_page
+        self._extract = extract
+        self.page_size = page_size
+        self.cursor = start
+        self.read_ahead = read_ahead
+        self.exhausted = False
+
+    def _page(self, response: BazonResponse) -> list:
+        if response.status_code != 200:
+            raise APIException(
+                detail=f"bazon_pagination_error (offset {self.cursor})",
+                code=response.status_code,
+            )
+        return self._extract(response)
+
+    def _advance(self, page: list):
+        # Сдвигаемся только после обработки страницы: при сбое обход продолжится с нее же
+        self.cursor += len(page)
+        if len(page) < self.page_size:
+            self.exhausted = True
+
+    def pages(self):
+        if not self.read_ahead:
+            while not self.exhausted:
+                page = self._page(self._fetch_page(self.cursor, self.page_size))
+                if page:
+                    yield page
+                self._advance(page)
+            return
+
+        # Приоритет лимитера (contextvars) должен дойти и до потока предзагрузки
+        context = contextvars.copy_context()
+
+        def fetch(offset: int):
+            return context.copy().run(self._fetch_page, offset, self.page_size)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(fetch, self.cursor)
+            while not self.exhausted:
+                page = self._page(future.result())
+                if len(page) >= self.page_size:
+                    future = executor.submit(fetch, self.cursor + len(page))
+                if page:
+                    yield page
+                self._advance(page)
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
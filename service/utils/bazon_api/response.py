@@ -0,0 +1,68 @@
+import orjson
+
+
+_UNSET = object()
+
+
+class BazonResponse:
+    """
+    Ответ Bazon: тело декодируется один раз (orjson) и кешируется.
+    Повторяет нужную часть интерфейса requests.Response (status_code, content, json()),
+    поэтому старый код с response.json() продолжает работать.
+
+    Формы ответов:
+        frontend-api  {"response": {"<method>": {...}}}        -> result(), entities()
+        external-api  {"response": [{"result": {"<key>": [...]}}]} -> external_result()
+    """
+
+    def __init__(self, response):
+        self.raw = response
+        self.status_code: int = response.status_code
+        self.content: bytes = response.content
+        self._data = _UNSET
+
+    def __repr__(self):
+        return f"<BazonResponse [{self.status_code}]>"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    @property
+    def headers(self):
+        return self.raw.headers
+
+    def raise_for_status(self):
+        self.raw.raise_for_status()
+
+    def json(self):
+        """Как requests.Response.json(): при невалидном теле бросает JSONDecodeError."""
+        if self._data is _UNSET:
+            self._data = orjson.loads(self.content)
+        return self._data
+
+    def data(self) -> dict:
+        """Декодированное тело или {}, если это не JSON-объект."""
+        try:
+            data = self.json()
+        except orjson.JSONDecodeError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def result(self, method: str) -> dict:
+        response = self.data().get("response")
+        if not isinstance(response, dict):
+            return {}
+        return response.get(method) or {}
+
+    def error(self, method: str):
+        return self.result(method).get("error")
+
+    def entities(self, method: str, list_key: str) -> list:
+        return self.result(method).get(list_key, {}).get("entitys", [])
+
+    def external_result(self, key: str) -> list:
+        response = self.data().get("response")
+        if not isinstance(response, list) or not response:
+            return []
+        return response[0].get("result", {}).get(key, [])
@@ -0,0 +1,119 @@
+import os
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from utils.rate_limit import RateLimiter
+
+
+class BazonTransport:
+    """
+    Keep-alive сессия с пулом соединений к Bazon.
+    Один экземпляр на аккаунт в процессе, его переиспользуют все клиенты Bazon.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int,
+        pool_maxsize: int,
+        connect_timeout: float,
+        read_timeout: float,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with _host_slot(url):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def _rate_limiter(account_key: str) -> RateLimiter | None:
+    rate = getattr(settings, "BAZON_RATE_LIMIT", None)
+    if not rate:
+        return None
+    return RateLimiter(
+        f"bazon:{account_key}",
+        rate,
+        background_reserve=settings.RATE_LIMIT_INTERACTIVE_RESERVE,
+    )
+
+
+_transports: dict[str, BazonTransport] = {}
+_transports_pid = os.getpid()
+_transports_lock = threading.Lock()
+
+# Ограничение одновременных запросов процесса к одному хосту Bazon, общее для всех
+# аккаунтов: сколько бы аккаунтов ни опрашивалось параллельно, хост получит
+# не больше BAZON_HOST_MAX_CONCURRENCY запросов сразу
+_host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+
+def _host_limit() -> int | None:
+    return getattr(settings, "BAZON_HOST_MAX_CONCURRENCY", None)
+
+
+@contextmanager
+def _host_slot(url: str):
+    limit = _host_limit()
+    if not limit:
+        yield
+        return
+    host = urlsplit(url).netloc
+    with _transports_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(limit)
+    with semaphore:
+        yield
+
+
+def get_transport(account_key: str) -> BazonTransport:
+    """
+    Возвращает транспорт аккаунта, создавая его при первом обращении.
+    После fork (gunicorn, celery prefork) пул родителя не переиспользуется.
+    """
+    global _transports_pid
+    with _transports_lock:
+        if _transports_pid != os.getpid():
+            _transports.clear()
+            _host_semaphores.clear()
+            _transports_pid = os.getpid()
+        transport = _transports.get(account_key)
+        if transport is None:
+            transport = BazonTransport(
+                pool_connections=getattr(settings, "BAZON_HTTP_POOL_CONNECTIONS", 4),
+                pool_maxsize=getattr(settings, "BAZON_HTTP_POOL_MAXSIZE", 10),
+                connect_timeout=getattr(settings, "BAZON_HTTP_CONNECT_TIMEOUT", 5.0),
+                read_timeout=getattr(settings, "BAZON_HTTP_READ_TIMEOUT", 30.0),
+                rate_limiter=_rate_limiter(account_key),
+            )
+            _transports[account_key] = transport
+        return transport
+
+
+def close_transports():
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
@@ -0,0 +1,14 @@
+import hashlib
+import orjson
+
+
+def fingerprint(data: dict, fields=None) -> str:
+    """
+    Стабильный отпечаток словаря (blake2b от orjson с сортировкой ключей).
+    fields - учитывать только эти ключи, отсутствующий ключ считается None.
+    """
+    if fields is not None:
+        data = {field: data.get(field) for field in fields}
+    return hashlib.blake2b(
+        orjson.dumps(data, option=orjson.OPT_SORT_KEYS), digest_size=8
+    ).hexdigest()
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class PostgresOnlyMixin:
+    """
+    Операция только для Postgres (GIN, pg_trgm): на других базах, например
+    sqlite в тестах, меняется лишь состояние миграций.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class PostgresAddIndex(PostgresOnlyMixin, migrations.AddIndex):
+    pass
+
+
+class PostgresRemoveIndex(PostgresOnlyMixin, migrations.RemoveIndex):
+    pass
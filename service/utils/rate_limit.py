@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django_redis import get_redis_connection
+from loguru import logger
+from redis.exceptions import RedisError
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority: ContextVar[str] = ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """
+    Запросы внутри блока идут фоновой полосой: поллинг, синхронизации, задачи celery.
+    По умолчанию (виджет) запросы интерактивные.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# Ведро токенов: пополняется rate токенов в секунду до capacity.
+# floor - сколько токенов запрос не имеет права трогать (резерв интерактивной полосы).
+# Возвращает сколько секунд подождать, "0" - токен выдан.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens - 1 >= floor then
+    tokens = tokens - 1
+else
+    wait = (floor + 1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimiter:
+    """
+    Ограничитель запросов к внешнему API, общий для всех процессов (ведро токенов в Redis).
+    Фоновые запросы не забирают последние background_reserve от емкости ведра,
+    поэтому при нехватке лимита интерактивные запросы виджета идут первыми.
+    """
+
+    def __init__(
+        self, key: str, rate: float, capacity: float = None, background_reserve=0.3
+    ):
+        self.key = f"rate_limit:{key}"
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.background_reserve = background_reserve
+        self._script = None
+
+    def _floor(self) -> float:
+        if _priority.get() == BACKGROUND:
+            return self.capacity * self.background_reserve
+        return 0
+
+    def _try_acquire(self) -> float:
+        try:
+            if self._script is None:
+                self._script = get_redis_connection("default").register_script(
+                    _TOKEN_BUCKET_SCRIPT
+                )
+            wait = self._script(
+                keys=[self.key], args=[self.rate, self.capacity, self._floor()]
+            )
+        except RedisError as error:
+            # Без Redis лучше работать без лимита, чем не работать совсем
+            logger.warning(f"Rate limiter {self.key} недоступен: {error}")
+            return 0
+        return float(wait)
+
+    def acquire(self):
+        while (wait := self._try_acquire()) > 0:
+            time.sleep(wait)
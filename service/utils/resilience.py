@@ -0,0 +1,141 @@
+import random
+import time
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from loguru import logger
+from rest_framework.exceptions import APIException
+
+
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+class UpstreamUnavailable(APIException):
+    status_code = 503
+    default_detail = "upstream_unavailable"
+    default_code = "upstream_unavailable"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель на внешний метод, состояние общее для всех процессов (Redis).
+
+    closed    - запросы идут, ошибки (5xx, обрывы) считаются в окне failure_window;
+    open      - после failure_threshold ошибок запросы сразу получают 503
+                в течение recovery_timeout;
+    half_open - пропускается один пробный запрос: успех закрывает, ошибка снова открывает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failure_threshold = getattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 5)
+        self.failure_window = getattr(settings, "CIRCUIT_FAILURE_WINDOW", 60)
+        self.recovery_timeout = getattr(settings, "CIRCUIT_RECOVERY_TIMEOUT", 30)
+        self._open_key = f"circuit:{name}:open"
+        self._tripped_key = f"circuit:{name}:tripped"
+        self._failures_key = f"circuit:{name}:failures"
+        self._probe_key = f"circuit:{name}:probe"
+        self._half_open = False
+
+    def _cache(self, method: str, *args, default=None, **kwargs):
+        """
+        Обращение к Redis. Redis недоступен - предохранитель считается закрытым
+        и запросы идут как без него, как и у RateLimiter.
+        """
+        try:
+            return getattr(cache, method)(*args, **kwargs)
+        except Exception as error:
+            logger.warning(f"Circuit breaker {self.name} недоступен: {error}")
+            return default
+
+    @property
+    def state(self) -> str:
+        state = self._cache("get_many", [self._open_key, self._tripped_key], default={})
+        if self._open_key in state:
+            return self.OPEN
+        if self._tripped_key in state:
+            return self.HALF_OPEN
+        return self.CLOSED
+
+    def before_call(self):
+        state = self.state
+        if state == self.OPEN:
+            raise UpstreamUnavailable()
+        if state == self.HALF_OPEN:
+            if not self._cache(
+                "add", self._probe_key, 1, timeout=self.recovery_timeout, default=True
+            ):
+                raise UpstreamUnavailable()
+            self._half_open = True
+
+    def record_success(self):
+        if self._half_open:
+            self._cache("delete_many", [self._tripped_key, self._probe_key])
+            self._half_open = False
+            logger.info(f"Circuit breaker {self.name} закрыт")
+
+    def record_failure(self):
+        if self._half_open:
+            failures = self.failure_threshold
+        else:
+            self._cache("add", self._failures_key, 0, timeout=self.failure_window)
+            failures = self._cache("incr", self._failures_key)
+            if failures is None:
+                return
+        if failures >= self.failure_threshold:
+            self._cache("set", self._open_key, 1, timeout=self.recovery_timeout)
+            self._cache("set", self._tripped_key, 1, timeout=None)
+            self._cache("delete_many", [self._failures_key, self._probe_key])
+            self._half_open = False
+            logger.error(f"Circuit breaker {self.name} открыт")
+
+
+class RetryPolicy:
+    """Повторы с экспоненциальной задержкой и full jitter."""
+
+    def __init__(self, attempts: int = None, backoff: float = None, max_backoff=None):
+        self.attempts = attempts or getattr(settings, "RETRY_ATTEMPTS", 3)
+        self.backoff = backoff or getattr(settings, "RETRY_BACKOFF", 0.2)
+        self.max_backoff = max_backoff or getattr(settings, "RETRY_MAX_BACKOFF", 2.0)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+def _is_retryable(response) -> bool:
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def _record(breaker: CircuitBreaker, response):
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def resilient_call(call, breaker: CircuitBreaker, retry: RetryPolicy | None = None):
+    """
+    call - функция без аргументов, делающая запрос.
+    Повторяет только при retry (идемпотентные чтения), ответ после последней попытки
+    возвращается как есть, обрыв соединения превращается в 503.
+    """
+    attempts = retry.attempts if retry else 1
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            response = call()
+        except TRANSPORT_ERRORS as error:
+            breaker.record_failure()
+            if attempt + 1 == attempts:
+                raise UpstreamUnavailable() from error
+            logger.warning(f"{breaker.name}: ошибка соединения, повтор ({error})")
+        else:
+            _record(breaker, response)
+            if attempt + 1 == attempts or not _is_retryable(response):
+                return response
+            logger.warning(f"{breaker.name}: ответ {response.status_code}, повтор")
+        time.sleep(retry.delay(attempt))
@@ -7,41 +7,71 @@ from amo.models import AmoAccount
 
 class BazonSaleToAmoLeadSerializer(BaseSerializer):
 
-    def __init__(self, amo_account: AmoAccount, *args, **kwargs):
+    def __init__(
+        self,
+        amo_account: AmoAccount,
+        *args,
+        statuses: dict | None = None,
+        managers: dict | None = None,
+        with_id: bool = True,
+        **kwargs,
+    ):
+        """
+        statuses, managers - заранее прочитанные {статус Bazon: id статуса amo}
+        и {id менеджера Bazon: id пользователя amo} (см. bazon.events.lead_lookups),
+        чтобы пачка сделок не читала их из БД на каждую сделку.
+        """
         self.amo_account = amo_account
+        self.statuses = statuses
+        self.managers = managers
+        self.with_id = with_id
         super().__init__(*args, **kwargs)
 
     def serialize(self):
 
         serialized_data = {"name": f"Сделка с Bazon №{self.data.get('number')}"}
-        try:
-            sale_document = SaleDocument.objects.filter(
-                internal_id=self.data.get("internal_id"), amo_account=self.amo_account
-            ).first()
-            amo_lead_id = sale_document.amo_lead_id
-            if amo_lead_id:
-                serialized_data["id"] = amo_lead_id
-        except ObjectDoesNotExist:
-            pass
+        if self.with_id:
+            try:
+                sale_document = SaleDocument.objects.filter(
+                    internal_id=self.data.get("internal_id"), amo_account=self.amo_account
+                ).first()
+                amo_lead_id = sale_document.amo_lead_id
+                if amo_lead_id:
+                    serialized_data["id"] = amo_lead_id
+            except ObjectDoesNotExist:
+                pass
         sum = self.data.get("sum")
         if sum:
             serialized_data["price"] = sum
         bazon_status = self.data.get("status")
         if bazon_status not in ["draft", "reserve", "issued", "canceled"]:
             bazon_status = self.data.get("state")
-        if Status.objects.filter(bazon_status=bazon_status).exists():
+        if self.statuses is not None:
+            if bazon_status in self.statuses:
+                serialized_data["status_id"] = self.statuses[bazon_status]
+        elif Status.objects.filter(bazon_status=bazon_status).exists():
             status = Status.objects.filter(
                 bazon_status=bazon_status, amo_account=self.amo_account
             ).first()
             serialized_data["status_id"] = status.amo_id
         manager_id = self.data.get("manager_id")
-        if Manager.objects.filter(
+        if self.managers is not None:
+            if manager_id in self.managers:
+                serialized_data["responsible_user_id"] = self.managers[manager_id]
+        elif Manager.objects.filter(
             bazon_id=manager_id, amo_account=self.amo_account
         ).exists():
             manager = Manager.objects.filter(
                 bazon_id=manager_id, amo_account=self.amo_account
             ).first()
             serialized_data["responsible_user_id"] = manager.amo_id
+        bazon_field = self.amo_account.get_config().get("bazon_field")
+        internal_id = self.data.get("internal_id")
+        if bazon_field and internal_id:
+            # Метка сделки: по ней outbox находит сделку, id которой не сохранился
+            serialized_data["custom_fields"] = [
+                {"field_id": int(bazon_field), "values": [{"value": str(internal_id)}]}
+            ]
         self._serialized_data = serialized_data
 
     def get_serialized_data(self, with_id: bool = True):
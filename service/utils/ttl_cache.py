@@ -0,0 +1,92 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from loguru import logger
+
+
+class TTLCache:
+    """
+    Двухуровневый кеш: L1 в памяти процесса и L2 в Redis, общий для всех процессов.
+
+    Запись свежая ttl секунд, затем еще stale_ttl отдается устаревшей,
+    а обновляется в фоне (stale-while-revalidate). Загрузку выполняет один процесс
+    (single-flight через Redis): при пустом кеше остальные ждут ее результата,
+    при устаревшем - сразу получают старое значение.
+
+        sources = TTLCache("bazon:reference:1").get("sources", load_sources)
+
+    loader - функция без аргументов; если она бросает исключение, значение
+    не кешируется, а исключение уходит вызвавшему (или в лог при фоновом обновлении).
+    """
+
+    _local: dict[str, tuple[float, dict]] = {}
+    _local_lock = threading.Lock()
+
+    def __init__(self, prefix: str, ttl: int = None, stale_ttl: int = None):
+        self.prefix = prefix
+        self.ttl = ttl or settings.REFERENCE_CACHE_TTL
+        self.stale_ttl = stale_ttl if stale_ttl is not None else settings.REFERENCE_CACHE_STALE_TTL
+        self.local_ttl = settings.REFERENCE_CACHE_L1_TTL
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def _get_local(self, key: str) -> dict | None:
+        cached = self._local.get(key)
+        if cached is None or cached[0] < time.monotonic():
+            return None
+        return cached[1]
+
+    def _set_local(self, key: str, entry: dict):
+        with self._local_lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, entry)
+
+    def _load(self, key: str, loader) -> dict:
+        entry = {"value": loader(), "fresh_until": time.time() + self.ttl}
+        cache.set(key, entry, timeout=self.ttl + self.stale_ttl)
+        self._set_local(key, entry)
+        return entry
+
+    def _refresh_in_background(self, key: str, loader):
+        # Метка живет, пока идет загрузка, чтобы не запускать ее в каждом процессе
+        if not cache.add(f"{key}:refreshing", 1, timeout=30):
+            return
+
+        def refresh():
+            try:
+                self._load(key, loader)
+            except Exception as error:
+                logger.warning(f"{key}: не удалось обновить кеш ({error})")
+            finally:
+                cache.delete(f"{key}:refreshing")
+                connections.close_all()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, name: str, loader):
+        key = self._key(name)
+        entry = self._get_local(key)
+        if entry is None:
+            entry = cache.get(key)
+            if entry is not None:
+                self._set_local(key, entry)
+
+        if entry is None:
+            with cache.lock(f"{key}:lock", timeout=30, blocking_timeout=30):
+                # Пока ждали блокировку, значение мог загрузить другой процесс
+                entry = cache.get(key)
+                if entry is None:
+                    entry = self._load(key, loader)
+                else:
+                    self._set_local(key, entry)
+        elif entry["fresh_until"] < time.time():
+            self._refresh_in_background(key, loader)
+        return entry["value"]
+
+    def invalidate(self, name: str):
+        key = self._key(name)
+        cache.delete(key)
+        with self._local_lock:
+            self._local.pop(key, None)